@@ -0,0 +1,34 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # ответы зависят от пользователя (флаги, подписки)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """304/412, если клиент прислал подходящие валидаторы, иначе None.
+
+    last_modified - unix-время в секундах.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    last_modified = int(last_modified) if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
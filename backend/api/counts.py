@@ -0,0 +1,119 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .versions import bump_version_on_commit, get_versions
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATED = 'estimated'
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+# меньше этого оценка планировщика слишком неточна, считаем честно
+ESTIMATE_MIN_ROWS = 10000
+
+_tracked_tables = set()
+
+
+def table_version_name(table):
+    return f'table:{table}'
+
+
+def _bump_on_insert(sender, created, using, **kwargs):
+    if created:
+        bump_version_on_commit(
+            table_version_name(sender._meta.db_table), using=using
+        )
+
+
+def _bump_on_delete(sender, using, **kwargs):
+    bump_version_on_commit(
+        table_version_name(sender._meta.db_table), using=using
+    )
+
+
+def _bump_on_m2m(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version_on_commit(
+            table_version_name(sender._meta.db_table), using=using
+        )
+
+
+def track_counts(*models):
+    """Сбрасывать закэшированные COUNT при вставке/удалении строк моделей.
+
+    Для M2M передаётся промежуточная модель (Model.field.through).
+    """
+    for model in models:
+        table = model._meta.db_table
+        _tracked_tables.add(table)
+        uid = f'track_counts:{table}'
+        # строки промежуточных моделей M2M меняют и add()/remove()
+        m2m_changed.connect(_bump_on_m2m, sender=model, dispatch_uid=uid)
+        if model._meta.auto_created:
+            continue
+        post_save.connect(_bump_on_insert, sender=model, dispatch_uid=uid)
+        post_delete.connect(_bump_on_delete, sender=model, dispatch_uid=uid)
+
+
+def exact_count(queryset):
+    return queryset.count()
+
+
+def cached_count(queryset):
+    if queryset.query.is_empty():
+        return 0
+    sql, params = queryset.query.sql_with_params()
+    tables = sorted(
+        table for table in _tracked_tables if f'"{table}"' in sql
+    )
+    versions = get_versions(*map(table_version_name, tables))
+    digest = hashlib.md5(
+        f'{queryset.db}|{sql}|{params}|{versions}'.encode()
+    ).hexdigest()
+    key = f'count:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def estimated_count(queryset):
+    """Оценка из pg_class для нефильтрованных таблиц PostgreSQL.
+
+    Во всех остальных случаях (фильтр, другая СУБД, маленькая таблица)
+    возвращает закэшированный точный COUNT.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    if (
+        connection.vendor == 'postgresql'
+        and not query.where
+        and not query.distinct
+        and not query.is_sliced
+    ):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= ESTIMATE_MIN_ROWS:
+            return int(row[0])
+    return cached_count(queryset)
+
+
+COUNT_STRATEGIES = {
+    COUNT_EXACT: exact_count,
+    COUNT_CACHED: cached_count,
+    COUNT_ESTIMATED: estimated_count,
+}
+
+
+def count_queryset(queryset, strategy=COUNT_EXACT):
+    if not hasattr(queryset, 'query'):
+        return len(queryset)
+    return COUNT_STRATEGIES[strategy](queryset)
@@ -0,0 +1,38 @@
+import uuid
+
+import filetype
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+# сигнатуры форматов лежат в первых байтах файла
+HEADER_SIZE = 8192
+
+
+class ImageUploadField(Base64ImageField):
+    """Изображение строкой base64 (JSON) или файлом (multipart).
+
+    Файл из multipart не декодируется: Django уже записал его частями во
+    временный файл, а формат и размеры проверяются по заголовку.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+
+        header = data.read(HEADER_SIZE)
+        data.seek(0)
+        extension = filetype.guess_extension(header)
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        try:
+            # Image.open читает только заголовок, пиксели не распаковываются;
+            # заодно срабатывает защита от decompression bomb
+            Image.open(data)
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            data.seek(0)
+        data.name = f'{uuid.uuid4()}.{extension}'
+        return data
@@ -0,0 +1,131 @@
+"""Уменьшенные копии и WebP-варианты загруженных изображений.
+
+Варианты строятся в пуле потоков после коммита транзакции и кладутся в
+хранилище рядом с оригиналом; их имена записываются в JSON-поле модели
+вместе с именем исходного файла ('source'). Пока вариантов нет, в API
+вместо них отдаётся оригинал.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# имя варианта: (максимальный размер, формат Pillow, расширение)
+IMAGE_VARIANTS = {
+    'thumbnail': ((480, 480), 'JPEG', 'jpg'),
+    'thumbnail_webp': ((480, 480), 'WEBP', 'webp'),
+    'webp': ((1600, 1600), 'WEBP', 'webp'),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def variants_outdated(field_file, variants):
+    return bool(field_file) and variants.get('source') != field_file.name
+
+
+def schedule_variants(instance, field_name, variants_field):
+    """Поставить построение вариантов в очередь после коммита."""
+    args = (
+        instance._meta.label, instance.pk, field_name, variants_field,
+        getattr(instance, field_name).name
+    )
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            build_variants_job, *args
+        ))
+    else:
+        transaction.on_commit(lambda: build_variants_safely(*args))
+
+
+def build_variants_safely(*args):
+    try:
+        build_variants(*args)
+    except Exception:
+        logger.exception('Не удалось построить варианты изображения %s', args)
+
+
+def build_variants_job(*args):
+    # поток пула живёт дольше запроса, соединение с БД закрываем сами
+    try:
+        build_variants_safely(*args)
+    finally:
+        close_old_connections()
+
+
+def render_variant(image, size, image_format):
+    image = image.copy()
+    image.thumbnail(size)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=82)
+    return buffer.getvalue()
+
+
+def build_variants(label, pk, field_name, variants_field, source):
+    model = apps.get_model(label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or getattr(instance, field_name).name != source:
+        # объект удалён или изображение уже заменено
+        return
+    storage = getattr(instance, field_name).storage
+    with storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    base = os.path.splitext(source)[0]
+    variants = {'source': source}
+    for name, (size, image_format, extension) in IMAGE_VARIANTS.items():
+        variants[name] = storage.save(
+            f'{base}_{name}.{extension}',
+            ContentFile(render_variant(image, size, image_format))
+        )
+
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).first()
+        if instance is None or getattr(instance, field_name).name != source:
+            return
+        setattr(instance, variants_field, variants)
+        # save, а не update: updated_at и сигналы сбрасывают кэши выдачи
+        update_fields = [variants_field]
+        if any(field.name == 'updated_at' for field in model._meta.fields):
+            update_fields.append('updated_at')
+        instance.save(update_fields=update_fields)
+
+
+def variant_urls(field_file, variants, request=None):
+    """URL всех вариантов; для ещё не построенных - URL оригинала."""
+    if not field_file:
+        return None
+    storage = field_file.storage
+    if variants.get('source') != field_file.name:
+        variants = {}
+    urls = {
+        name: storage.url(variants.get(name, field_file.name))
+        for name in IMAGE_VARIANTS
+    }
+    if request is not None:
+        urls = {
+            name: request.build_absolute_uri(url)
+            for name, url in urls.items()
+        }
+    return urls
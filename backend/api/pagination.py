@@ -1,8 +1,45 @@
-from rest_framework.pagination import PageNumberPagination
+from functools import cached_property, partial
+
+from django.core.paginator import Paginator
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
+from .counts import COUNT_EXACT, count_queryset
+
+
+class CountStrategyPaginator(Paginator):
+    def __init__(self, *args, count_strategy=COUNT_EXACT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+
+    @cached_property
+    def count(self):
+        return count_queryset(self.object_list, self.count_strategy)
+
+
+class CountStrategyPagination(PageNumberPagination):
+    """Пагинация, считающая count выбранной во view стратегией.
+
+    View задаёт атрибут count_strategy: exact, cached или estimated
+    (см. api.counts).
+    """
+
+    count_strategy = COUNT_EXACT
+
+    @property
+    def django_paginator_class(self):
+        return partial(
+            CountStrategyPaginator, count_strategy=self.count_strategy
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = getattr(
+            view, 'count_strategy', self.count_strategy
+        )
+        return super().paginate_queryset(queryset, request, view)
+
 
-class LimitPageNumberPagination(PageNumberPagination):
+class LimitPageNumberPagination(CountStrategyPagination):
     page_size = 6
     page_size_query_param = 'limit'
 
@@ -13,3 +50,40 @@ class LimitPageNumberPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-created_at', '-id')
+
+
+class FeedPagination(LimitPageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    С ?pagination=cursor выдача идёт по ключу (created_at, id) без OFFSET
+    и без COUNT: ответ содержит только next, previous и results. Если
+    queryset уже упорядочен иначе (например, по релевантности поиска),
+    курсор неприменим и используется обычная постраничная выдача.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    cursor_pagination_class = LimitCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            and not queryset.query.order_by
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
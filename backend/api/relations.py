@@ -0,0 +1,128 @@
+"""Добавление и удаление строк-связей одним SQL-запросом.
+
+Повторная вставка упирается в уникальное ограничение и ничего не делает
+(ON CONFLICT DO NOTHING), а RETURNING сообщает, какие строки на самом
+деле добавлены или удалены, - без предварительного exists() и без гонки
+между проверкой и записью.
+
+ORM при этом не участвует, поэтому post_save/post_delete отправляются
+здесь же. Для автоматических through-моделей M2M сигналов нет: о
+записанных строках вызывающий код заботится сам.
+"""
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def insert_rows(model, rows):
+    """Вставить строки (словари значений полей), которых ещё нет.
+
+    Возвращает только реально добавленные объекты.
+    """
+    if not rows:
+        return []
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.concrete_fields
+        if field is not model._meta.pk
+    ]
+    params = []
+    for values in rows:
+        instance = model(**values)
+        params += [
+            field.get_db_prep_save(field.pre_save(instance, True), connection)
+            for field in fields
+        ]
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES {", ".join([placeholders] * len(rows))} '
+        f'ON CONFLICT DO NOTHING RETURNING {_columns(model, connection)}'
+    )
+    with transaction.atomic(using=using):
+        created = _execute(model, using, sql, params)
+        if not model._meta.auto_created:
+            for instance in created:
+                post_save.send(
+                    sender=model, instance=instance, created=True,
+                    update_fields=None, raw=False, using=using
+                )
+    return created
+
+
+def insert_row(model, **values):
+    """Вставить строку, если её ещё нет; вернуть объект или None."""
+    created = insert_rows(model, [values])
+    return created[0] if created else None
+
+
+def delete_rows(model, **filters):
+    """Удалить строки с заданными значениями полей; вернуть удалённые.
+
+    Значение-список превращается в IN (...).
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for name, value in filters.items():
+        field = model._meta.get_field(name)
+        if not isinstance(value, (list, tuple, set)):
+            conditions.append(f'{quote(field.column)} = %s')
+            params.append(field.get_db_prep_value(value, connection))
+            continue
+        if not value:
+            return []
+        conditions.append(
+            f'{quote(field.column)} IN ({", ".join(["%s"] * len(value))})'
+        )
+        params += [field.get_db_prep_value(item, connection) for item in value]
+    sql = (
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {" AND ".join(conditions)} '
+        f'RETURNING {_columns(model, connection)}'
+    )
+    with transaction.atomic(using=using):
+        deleted = _execute(model, using, sql, params)
+        if not model._meta.auto_created:
+            for instance in deleted:
+                post_delete.send(
+                    sender=model, instance=instance, using=using,
+                    origin=instance
+                )
+    return deleted
+
+
+def _columns(model, connection):
+    return ', '.join(
+        connection.ops.quote_name(field.column)
+        for field in model._meta.concrete_fields
+    )
+
+
+def _execute(model, using, sql, params):
+    """Выполнить запрос с RETURNING всех полей и собрать объекты."""
+    connection = connections[using]
+    fields = model._meta.concrete_fields
+    columns = [field.get_col(model._meta.db_table) for field in fields]
+    # как SQLCompiler.apply_converters: сырые значения курсора в Python
+    converters = [
+        connection.ops.get_db_converters(column)
+        + column.get_db_converters(connection)
+        for column in columns
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    attnames = [field.attname for field in fields]
+    instances = []
+    for row in rows:
+        values = []
+        for value, column, column_converters in zip(row, columns, converters):
+            for converter in column_converters:
+                value = converter(value, column, connection)
+            values.append(value)
+        instances.append(model.from_db(using, attnames, values))
+    return instances
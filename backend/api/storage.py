@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по SHA-256 содержимого: upload_to/ab/abcdef….ext.
+
+    Одинаковые байты попадают в один и тот же файл, повторная запись
+    пропускается, а содержимое по URL никогда не меняется - его можно
+    кэшировать навсегда. Так как файл может быть общим у нескольких
+    объектов, удалять его можно только командой cleanup_media.
+    """
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        parent, shard = os.path.split(directory)
+        if len(shard) == 2 and filename.startswith(shard):
+            # имя построено от уже сохранённого файла (например, вариант
+            # изображения) - кладём в тот же upload_to, а не уровнем ниже
+            directory = parent
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            # cleanup_media не трогает файлы моложе --min-age: обновлённое
+            # время изменения защищает файл, который только что стал
+            # снова нужен, даже если команда уже собрала список ссылок
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                # файл удалили между проверкой и utime - пишем заново
+                pass
+        return super()._save(name, content)
@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(name):
+    return f'version:{name}'
+
+
+def get_versions(*names):
+    """Метки изменения по именам.
+
+    Отсутствующая метка (новый процесс, вытеснение из кэша) выставляется
+    текущим временем, а не считается нулём: иначе после перезапуска она
+    совпала бы с прежней и ETag подтвердил бы устаревший ответ.
+    """
+    keys = [version_key(name) for name in names]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    now = time.time()
+    if missing:
+        for key in missing:
+            cache.add(key, now, None)
+        values.update(cache.get_many(missing))
+    return [values.get(key, now) for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(*names):
+    now = time.time()
+    cache.set_many({version_key(name): now for name in names}, None)
+
+
+def bump_version_on_commit(*names, using=None):
+    """bump_version после коммита транзакции (вне транзакции - сразу).
+
+    Метку, сдвинутую до коммита, параллельный запрос успел бы связать
+    с ещё старыми данными и закэшировать их под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(*names), using=using)
@@ -135,6 +135,27 @@ STATICFILES_DIRS = []
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media/'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# загрузки больше этого Django пишет частями во временный файл,
+# а не держит в памяти
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# потоки для построения вариантов изображений (api.images);
+# 0 - строить синхронно после коммита
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# у авторов с большим числом подписчиков новые рецепты не раскладываются
+# по лентам подписок, а читаются при запросе ленты (recipes.timeline)
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 1000))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -161,3 +182,16 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+
+# Cache
+# Для нескольких процессов gunicorn задайте общий бэкенд (например, redis)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
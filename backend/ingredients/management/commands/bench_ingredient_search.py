@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ingredients.models import Ingredient
+from ingredients.search import IngredientPrefixIndex, ingredients_version
+from ingredients.serializers import IngredientSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient autocomplete: ORM istartswith vs prefix index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--prefix-length', type=int, default=2,
+            help='Length of the name prefixes used as queries'
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        length = options['prefix_length']
+        prefixes = sorted({
+            name[:length] for name in
+            Ingredient.objects.values_list('name', flat=True)
+            if len(name) >= length
+        })
+        if not prefixes:
+            self.stdout.write('Нет ингредиентов для замера.')
+            return
+
+        def orm_search(prefix):
+            queryset = Ingredient.objects.filter(name__istartswith=prefix)
+            return IngredientSerializer(queryset, many=True).data
+
+        index = IngredientPrefixIndex()
+        version = ingredients_version()
+        started = time.perf_counter()
+        index.all(version)
+        build_time = time.perf_counter() - started
+
+        def index_search(prefix):
+            # как во view: версия считается один раз на запрос
+            return index.search(prefix, version=ingredients_version())
+
+        timings = {}
+        for label, search in (('orm', orm_search), ('index', index_search)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for prefix in prefixes:
+                    search(prefix)
+            timings[label] = time.perf_counter() - started
+
+        calls = repeat * len(prefixes)
+        for label, total in timings.items():
+            self.stdout.write(
+                f'{label:>5}: {total * 1000 / calls:.3f} мс на запрос '
+                f'({calls} запросов)'
+            )
+        self.stdout.write(f'Построение индекса: {build_time * 1000:.1f} мс')
+        self.stdout.write(self.style.SUCCESS(
+            f"Ускорение: x{timings['orm'] / timings['index']:.1f}"
+        ))
@@ -1,32 +1,135 @@
+import csv
 import json
-from django.core.management.base import BaseCommand
+import time
+from pathlib import Path
 
+from django.core.management.base import BaseCommand, CommandError
+
+from api.versions import bump_version
 from ingredients.models import Ingredient
+from ingredients.search import INDEX_VERSION
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Элементы JSON-массива верхнего уровня без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON.')
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            return
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+READERS = {'json': iter_json, 'csv': iter_csv}
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients from JSON file (idempotent)'
+    help = (
+        'Load ingredients from JSON or CSV file (idempotent, batched upsert)'
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument('json_file', type=str, help='Path to ingredients.json')
+        parser.add_argument(
+            'path', type=str, help='Path to ingredients.json or .csv'
+        )
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='File format; detected from the extension by default'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only show ingredients that would be added'
+        )
 
     def handle(self, *args, **options):
-        json_file_path = options['json_file']
-        with open(json_file_path, encoding='utf-8') as file:
-            ingredients = json.load(file)
-
-        created = 0
-        skipped = 0
-
-        for item in ingredients:
-            name = item.get("name")
-            unit = item.get("measurement_unit")
-            obj, is_created = Ingredient.objects.get_or_create(name=name, measurement_unit=unit)
-            if is_created:
-                created += 1
-            else:
-                skipped += 1
+        path = Path(options['path'])
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {path.suffix or path.name}.'
+            )
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
 
+        started = time.perf_counter()
+        count_before = Ingredient.objects.count()
+        seen = set()
+        read = new = 0
+        batch = []
+        with open(path, encoding='utf-8', newline='') as file:
+            for name, unit in READERS[file_format](file):
+                read += 1
+                item = (name.strip(), unit.strip())
+                if not all(item) or item in seen:
+                    continue
+                seen.add(item)
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    new += self.flush(batch, dry_run)
+                    batch = []
+        new += self.flush(batch, dry_run)
+        if not dry_run:
+            new = Ingredient.objects.count() - count_before
+            bump_version(INDEX_VERSION)
+
+        elapsed = time.perf_counter() - started
+        rate = read / elapsed if elapsed else read
+        added = 'будет добавлено' if dry_run else 'добавлено'
         self.stdout.write(self.style.SUCCESS(
-            f"Готово. Добавлено: {created}, пропущено (уже есть): {skipped}."
+            f'Готово. Прочитано: {read}, уникальных: {len(seen)}, '
+            f'{added}: {new}, уже есть: {len(seen) - new}. '
+            f'{elapsed:.2f} с, {rate:.0f} записей/с.'
         ))
+
+    def flush(self, batch, dry_run):
+        if not batch:
+            return 0
+        if not dry_run:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch
+                ],
+                ignore_conflicts=True
+            )
+            return 0
+        existing = set(
+            Ingredient.objects.filter(
+                name__in={name for name, _ in batch}
+            ).values_list('name', 'measurement_unit')
+        )
+        added = [item for item in batch if item not in existing]
+        for name, unit in added:
+            self.stdout.write(f'+ {name} ({unit})')
+        return len(added)
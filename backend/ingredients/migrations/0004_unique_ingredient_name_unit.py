@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('ingredients', 'Ingredient')
+    RecipeIngredient = apps.get_model('ingredients', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep = group['keep']
+        extra = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=keep).values_list('pk', flat=True))
+        RecipeIngredient.objects.filter(ingredient_id__in=extra).update(
+            ingredient_id=keep
+        )
+        for item in ShoppingListItem.objects.filter(ingredient_id__in=extra):
+            kept, _ = ShoppingListItem.objects.get_or_create(
+                user_id=item.user_id,
+                ingredient_id=keep,
+                defaults={'total_amount': 0}
+            )
+            kept.total_amount += item.total_amount
+            kept.save()
+            item.delete()
+        Ingredient.objects.filter(pk__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0003_alter_ingredient_options_and_more'),
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
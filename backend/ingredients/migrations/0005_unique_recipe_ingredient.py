@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+MAX_INGREDIENT_AMOUNT = 32000
+
+
+def merge_duplicate_recipe_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('ingredients', 'RecipeIngredient')
+
+    # количества складываются, поэтому списки покупок не меняются
+    duplicates = RecipeIngredient.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        keep=Min('id'), amount=Sum('amount'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in duplicates:
+        RecipeIngredient.objects.filter(
+            recipe_id=group['recipe'], ingredient_id=group['ingredient']
+        ).exclude(pk=group['keep']).delete()
+        RecipeIngredient.objects.filter(pk=group['keep']).update(
+            amount=min(group['amount'], MAX_INGREDIENT_AMOUNT)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0004_unique_ingredient_name_unit'),
+        ('recipes', '0004_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_recipe_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+import bisect
+import re
+import threading
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from api.versions import get_version
+
+from .models import Ingredient
+
+INDEX_VERSION = 'ingredients'
+TABLE_CHECK_INTERVAL = 60
+
+WORD_START = re.compile(r'(?<=[\s\-(])\w')
+
+
+def table_state():
+    state = Ingredient.objects.aggregate(count=Count('pk'), last=Max('pk'))
+    return state['count'], state['last']
+
+
+def ingredients_version():
+    """Версия справочника: метка INDEX_VERSION и состояние таблицы.
+
+    Метку сдвигают сигналы и load_ingredients, но только в кэше своего
+    процесса. Поэтому число строк и наибольший id таблицы тоже входят в
+    версию; они берутся из кэша и перечитываются из базы не чаще раза в
+    TABLE_CHECK_INTERVAL секунд (и сразу после смены метки).
+    """
+    version = get_version(INDEX_VERSION)
+    state = cache.get_or_set(
+        f'ingredients-table:{version}', table_state, TABLE_CHECK_INTERVAL
+    )
+    return (version, *state)
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов по началу названия в памяти процесса.
+
+    Строки отсортированы по casefold-названию, поэтому совпадения с
+    начала названия - это непрерывный срез. За ними идут совпадения с
+    начала следующих слов ("сок" -> "апельсиновый сок"). Индекс
+    перестраивается, когда меняется ingredients_version(); её можно
+    передать готовой, чтобы не считать второй раз.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._rows = []
+        self._names = []
+        self._words = []
+
+    def _build(self, version):
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        names = [row['name'].casefold() for row in rows]
+        words = sorted(
+            (name[match.start():], position)
+            for position, name in enumerate(names)
+            for match in WORD_START.finditer(name)
+        )
+        self._rows, self._names, self._words = rows, names, words
+        self._version = version
+
+    def _ensure_fresh(self, version=None):
+        if version is None:
+            version = ingredients_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build(version)
+
+    def all(self, version=None):
+        self._ensure_fresh(version)
+        return self._rows
+
+    def search(self, prefix, limit=None, version=None):
+        self._ensure_fresh(version)
+        rows, names, words = self._rows, self._names, self._words
+        prefix = prefix.casefold()
+        if not prefix:
+            return rows[:limit]
+
+        start = bisect.bisect_left(names, prefix)
+        end = start
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        result = rows[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+
+        positions = set()
+        index = bisect.bisect_left(words, (prefix,))
+        while index < len(words) and words[index][0].startswith(prefix):
+            position = words[index][1]
+            if not start <= position < end:
+                positions.add(position)
+            index += 1
+        result += [rows[position] for position in sorted(positions)]
+        return result[:limit]
+
+
+ingredient_index = IngredientPrefixIndex()
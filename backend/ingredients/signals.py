@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.versions import bump_version_on_commit
+
+from .models import Ingredient
+from .search import INDEX_VERSION
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    bump_version_on_commit(INDEX_VERSION)
@@ -1,19 +1,31 @@
-from rest_framework import viewsets, filters, permissions
+from rest_framework import viewsets, permissions
+from rest_framework.response import Response
+from api.conditional import conditional_response, make_etag, set_validators
 from ingredients.models import Ingredient
+from .search import ingredient_index, ingredients_version
 from .serializers import IngredientSerializer
 
 
-class IngredientNameFilter(filters.BaseFilterBackend):
-    def filter_queryset(self, request, queryset, view):
-        name_param = request.query_params.get('name')
-        if name_param:
-            return queryset.filter(name__istartswith=name_param)
-        return queryset
-
-
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = [IngredientNameFilter]
+    # ?name= ищет только в списке, и тот отдаётся из индекса
+    filter_backends = []
     permission_classes = [permissions.AllowAny]
     pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        # версия справочника берётся из кэша, в базу этот запрос не
+        # ходит; Last-Modified из неё не вывести
+        version = ingredients_version()
+        etag = make_etag(request.get_full_path(), *version)
+        response = conditional_response(request, etag)
+        if response is not None:
+            return response
+        # список и автодополнение отдаются из индекса в памяти
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        response = Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit, version
+        ))
+        return set_validators(response, etag)
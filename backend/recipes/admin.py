@@ -9,17 +9,13 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     search_fields = ('name', 'author__email', 'author__username')
     list_filter = ('name', 'author')
     inlines = (RecipeIngredientInline,)
-    exclude = ('ingredients',)
+    exclude = ('ingredients', 'shopping_cart')
     empty_value_display = '-пусто-'
 
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-    favorites_count.short_description = 'В избранном'
-
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
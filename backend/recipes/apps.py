@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from api.counts import track_counts
+        from . import signals  # noqa: F401
+        from .models import Favorite, Recipe
+
+        track_counts(Recipe, Favorite, Recipe.shopping_cart.through)
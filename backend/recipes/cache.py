@@ -0,0 +1,43 @@
+from django.core.cache import cache
+
+RECIPE_PAYLOAD_TIMEOUT = 60 * 60 * 24
+
+
+def recipe_payload_key(recipe):
+    # updated_at в ключе: сохранение рецепта само делает старую запись мёртвой
+    return f'recipe-payload:{recipe.pk}:{recipe.updated_at.timestamp()}'
+
+
+def author_payload_key(author_id):
+    return f'recipe-author:{author_id}'
+
+
+def invalidate_author_payload(author_id):
+    cache.delete(author_payload_key(author_id))
+
+
+def get_shared_payloads(recipes, build_recipe, build_author):
+    """Общая для всех пользователей часть рецептов и их авторов.
+
+    Возвращает список пар (recipe_payload, author_payload) в порядке
+    recipes; отсутствующие в кэше записи строятся и сохраняются разом.
+    """
+    keys = [
+        (recipe_payload_key(recipe), author_payload_key(recipe.author_id))
+        for recipe in recipes
+    ]
+    cached = cache.get_many({key for pair in keys for key in pair})
+    missing = {}
+    for recipe, (recipe_key, author_key) in zip(recipes, keys):
+        if recipe_key not in cached:
+            missing[recipe_key] = cached[recipe_key] = build_recipe(recipe)
+        if author_key not in cached:
+            missing[author_key] = cached[author_key] = build_author(
+                recipe.author
+            )
+    if missing:
+        cache.set_many(missing, RECIPE_PAYLOAD_TIMEOUT)
+    return [
+        (cached[recipe_key], cached[author_key])
+        for recipe_key, author_key in keys
+    ]
@@ -0,0 +1,42 @@
+"""Денормализованные счётчики популярности.
+
+Поддерживаются сигналами из recipes.signals через атомарные F()-обновления,
+расхождения исправляет команда reconcile_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow
+
+from .models import Favorite, Recipe
+
+User = get_user_model()
+
+
+def adjust_counter(model, pks, field, delta):
+    # Greatest не даёт уйти в минус, если счётчик уже разошёлся с данными
+    model.objects.filter(pk__in=list(pks)).update(
+        **{field: Greatest(F(field) + delta, Value(0))}
+    )
+
+
+def count_subquery(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def counter_definitions():
+    """(модель, поле счётчика, выражение с фактическим значением)."""
+    return [
+        (Recipe, 'favorites_count',
+         count_subquery(Favorite.objects.all(), 'recipe')),
+        (Recipe, 'in_carts_count',
+         count_subquery(Recipe.shopping_cart.through.objects.all(), 'recipe')),
+        (User, 'recipes_count',
+         count_subquery(Recipe.objects.all(), 'author')),
+        (User, 'followers_count',
+         count_subquery(Follow.objects.all(), 'following')),
+    ]
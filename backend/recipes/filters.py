@@ -1,30 +1,80 @@
 import django_filters
+from django import forms
+from django_filters.widgets import BooleanWidget
+from .ingredient_sets import filter_by_ingredients
 from .models import Recipe
+from .search import search_recipes
+from .trending import ORDERINGS, order_by_score
+
+
+class IntegerFilter(django_filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class IdListFilter(django_filters.BaseInFilter, IntegerFilter):
+    pass
 
 
 class RecipeFilter(django_filters.FilterSet):
-    is_favorited = django_filters.BooleanFilter(method='filter_is_favorited')
+    is_favorited = django_filters.BooleanFilter(
+        method='filter_is_favorited',
+        widget=BooleanWidget()
+    )
     is_in_shopping_cart = django_filters.BooleanFilter(
-        method='filter_is_in_shopping_cart'
+        method='filter_is_in_shopping_cart',
+        widget=BooleanWidget()
     )
     author = django_filters.NumberFilter(field_name='author__id')
+    search = django_filters.CharFilter(method='filter_search')
+    # по умолчанию - новые первыми
+    ordering = django_filters.ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='filter_ordering'
+    )
+    # id ингредиентов через запятую, применяются вместе в filter_queryset
+    ingredients = IdListFilter(method='skip_filter')
+    exclude_ingredients = IdListFilter(method='skip_filter')
+    available = IdListFilter(method='skip_filter')
+    # сколько ингредиентов рецепта может не быть среди available
+    max_missing = IntegerFilter(method='skip_filter', min_value=0)
 
     class Meta:
         model = Recipe
         fields = ['author']
 
+    # queryset приходит из Recipe.objects.with_user_flags,
+    # поэтому фильтруем по уже посчитанным Exists-аннотациям
     def filter_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        if not user.is_authenticated:
-            return queryset.none()
         if value:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if not user.is_authenticated:
-            return queryset.none()
         if value:
-            return queryset.filter(shopping_cart=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        # упорядочивает по релевантности, см. recipes.search
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        # рейтинг заранее посчитан командой compute_trending
+        return order_by_score(queryset, value)
+
+    def skip_filter(self, queryset, name, value):
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+        if not (data['ingredients'] or data['exclude_ingredients']
+                or data['available']):
+            return queryset
+        return filter_by_ingredients(
+            queryset,
+            include=data['ingredients'] or (),
+            exclude=data['exclude_ingredients'] or (),
+            available=data['available'] or None,
+            max_missing=data['max_missing'] or 0
+        )
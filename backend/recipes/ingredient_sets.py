@@ -0,0 +1,273 @@
+"""Фильтры «что приготовить из того, что есть» по составу рецептов.
+
+Состав всех рецептов держится в памяти процесса битовой матрицей
+ингредиент x рецепт (numpy, по биту на пару): «есть все из списка» - это
+AND строк матрицы, «нет ни одного» - OR, а число недостающих ингредиентов
+для каждого рецепта - размер рецепта минус сумма строк того, что есть.
+
+Индекс догоняет базу по версии SETS_VERSION: после коммита изменения
+состава перечитываются только рецепты с новым updated_at. Найденные id
+накладываются на queryset одним параметром-массивом (id_list), а не
+тысячами плейсхолдеров pk__in; очень длинные списки id и фильтр только
+по исключениям уходят в SQL (filter_by_ingredients_sql).
+"""
+import json
+import threading
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.db import connections
+from django.db.models import Count, Exists, Max, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from api.versions import bump_version_on_commit, get_version
+from ingredients.models import RecipeIngredient
+
+from .models import Recipe
+
+SETS_VERSION = 'recipe-ingredient-sets'
+# дальше список id тяжелее, чем сам SQL-фильтр
+MAX_ID_LIST = 50000
+# запас на транзакции, закоммиченные позже соседних с большим updated_at
+SYNC_OVERLAP = timedelta(minutes=1)
+CHUNK_SIZE = 10000
+
+
+def schedule_sync():
+    bump_version_on_commit(SETS_VERSION)
+
+
+def _capacity(count, minimum=8):
+    return max(minimum, 1 << (count - 1).bit_length())
+
+
+def _bit(row):
+    return row >> 3, np.uint8(0x80 >> (row & 7))
+
+
+class CompositionIndex:
+    """Индекс по составу рецептов в памяти процесса.
+
+    Подкласс строит его целиком в _load и обновляет по рецепту в
+    _set_recipe; _rows отображает id рецепта в номер строки индекса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._synced_at = None
+        self._rows = {}
+
+    def _load(self, recipe_ids, rows, ingredient_ids):
+        """recipe_ids - id всех рецептов по возрастанию, rows и
+        ingredient_ids - пары (номер рецепта в recipe_ids, ингредиент)."""
+        raise NotImplementedError
+
+    def _set_recipe(self, recipe_id, ingredient_ids):
+        raise NotImplementedError
+
+    def _build(self):
+        synced_at = Recipe.objects.aggregate(last=Max('updated_at'))['last']
+        recipe_ids = np.fromiter(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+            .iterator(chunk_size=CHUNK_SIZE),
+            np.int64
+        )
+        pairs = np.fromiter(
+            chain.from_iterable(
+                RecipeIngredient.objects.order_by()
+                .values_list('recipe_id', 'ingredient_id')
+                .iterator(chunk_size=CHUNK_SIZE)
+            ),
+            np.int64
+        ).reshape(-1, 2)
+        # рецепты, созданные между двумя запросами, подберёт _sync
+        rows = np.searchsorted(recipe_ids, pairs[:, 0])
+        known = rows < len(recipe_ids)
+        known[known] = recipe_ids[rows[known]] == pairs[known, 0]
+        self._load(recipe_ids, rows[known], pairs[known, 1])
+        self._synced_at = synced_at
+
+    def _sync(self):
+        if self._synced_at is None:
+            self._build()
+            return
+        changed = dict(Recipe.objects.filter(
+            updated_at__gte=self._synced_at - SYNC_OVERLAP
+        ).values_list('pk', 'updated_at'))
+        compositions = {recipe_id: [] for recipe_id in changed}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=list(changed)
+        ).order_by().values_list('recipe_id', 'ingredient_id'):
+            compositions[recipe_id].append(ingredient_id)
+        for recipe_id, ingredient_ids in compositions.items():
+            self._set_recipe(recipe_id, ingredient_ids)
+        if changed:
+            self._synced_at = max(self._synced_at, *changed.values())
+        if Recipe.objects.count() != len(self._rows):
+            # рецепты удалялись: строки не переиспользуются, собираем заново
+            self._build()
+
+    def _ensure_fresh(self):
+        version = get_version(SETS_VERSION)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._sync()
+                self._version = version
+
+
+class IngredientSetIndex(CompositionIndex):
+    """Битовая матрица ингредиент x рецепт с размерами рецептов."""
+
+    def __init__(self):
+        super().__init__()
+        self._reset(0, 0)
+
+    def _reset(self, recipes, ingredients):
+        capacity = _capacity(recipes)
+        self._count = 0
+        self._rows = {}
+        self._recipe_ids = np.zeros(capacity, np.int64)
+        # -1 - ещё не занятая строка
+        self._sizes = np.full(capacity, -1, np.int32)
+        self._slots = {}
+        self._bits = np.zeros(
+            (_capacity(ingredients), capacity // 8), np.uint8
+        )
+
+    def _grow(self, recipes, ingredients):
+        capacity = len(self._recipe_ids)
+        if recipes > capacity:
+            extra = _capacity(recipes) - capacity
+            self._recipe_ids = np.pad(self._recipe_ids, (0, extra))
+            self._sizes = np.pad(self._sizes, (0, extra), constant_values=-1)
+            self._bits = np.pad(self._bits, ((0, 0), (0, extra // 8)))
+        if ingredients > len(self._bits):
+            extra = _capacity(ingredients) - len(self._bits)
+            self._bits = np.pad(self._bits, ((0, extra), (0, 0)))
+
+    def _slot(self, ingredient_id):
+        slot = self._slots.get(ingredient_id)
+        if slot is None:
+            slot = self._slots[ingredient_id] = len(self._slots)
+            self._grow(self._count, len(self._slots))
+        return slot
+
+    def _set_recipe(self, recipe_id, ingredient_ids):
+        row = self._rows.get(recipe_id)
+        if row is None:
+            row = self._rows[recipe_id] = self._count
+            self._count += 1
+            self._grow(self._count, len(self._slots))
+            self._recipe_ids[row] = recipe_id
+        # слоты до записи: новый ингредиент может пересоздать матрицу
+        slots = [self._slot(pk) for pk in ingredient_ids]
+        byte, mask = _bit(row)
+        self._bits[:, byte] &= ~mask
+        self._bits[slots, byte] |= mask
+        self._sizes[row] = len(ingredient_ids)
+
+    def _load(self, recipe_ids, rows, ingredient_ids):
+        unique, slots = np.unique(ingredient_ids, return_inverse=True)
+        count = len(recipe_ids)
+        self._reset(count, len(unique))
+        self._count = count
+        self._rows = dict(zip(recipe_ids.tolist(), range(count)))
+        self._recipe_ids[:count] = recipe_ids
+        self._sizes[:count] = np.bincount(rows, minlength=count)
+        self._slots = dict(zip(unique.tolist(), range(len(unique))))
+        np.bitwise_or.at(
+            self._bits, (slots, rows >> 3),
+            (0x80 >> (rows & 7)).astype(np.uint8)
+        )
+
+    def match(self, include=(), exclude=(), available=None, max_missing=0):
+        """Массив id рецептов, подходящих под условия.
+
+        include - все ингредиенты должны быть в рецепте, exclude - ни
+        одного; если задан available, в рецепте не больше max_missing
+        ингредиентов не из этого списка.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            count = self._count
+            sizes = self._sizes[:count]
+            mask = sizes >= 0
+            if include:
+                slots = [self._slots.get(pk) for pk in set(include)]
+                if None in slots:
+                    return np.zeros(0, np.int64)
+                mask &= self._unpack(
+                    np.bitwise_and.reduce(self._bits[slots]), count
+                )
+            slots = self._known_slots(exclude)
+            if slots:
+                mask &= ~self._unpack(
+                    np.bitwise_or.reduce(self._bits[slots]), count
+                )
+            if available is not None:
+                present = np.zeros(count, np.int32)
+                for slot in self._known_slots(available):
+                    present += self._unpack(self._bits[slot], count)
+                mask &= sizes - present <= max_missing
+            return self._recipe_ids[:count][mask]
+
+    def _known_slots(self, ingredient_ids):
+        return [
+            self._slots[pk] for pk in set(ingredient_ids) if pk in self._slots
+        ]
+
+    @staticmethod
+    def _unpack(bits, count):
+        return np.unpackbits(bits, count=count).view(bool)
+
+
+ingredient_set_index = IngredientSetIndex()
+
+
+def filter_by_ingredients_sql(queryset, include=(), exclude=(),
+                              available=None, max_missing=0):
+    """То же, что IngredientSetIndex.match, средствами SQL."""
+    rows = RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+    for ingredient_id in set(include):
+        queryset = queryset.filter(
+            Exists(rows.filter(ingredient_id=ingredient_id))
+        )
+    if exclude:
+        queryset = queryset.filter(
+            ~Exists(rows.filter(ingredient_id__in=exclude))
+        )
+    if available is not None:
+        missing = rows.exclude(ingredient_id__in=available).order_by().values(
+            'recipe'
+        ).annotate(count=Count('pk')).values('count')
+        queryset = queryset.alias(
+            missing_ingredients=Coalesce(Subquery(missing), 0)
+        ).filter(missing_ingredients__lte=max_missing)
+    return queryset
+
+
+def id_list(ids, using):
+    """Подзапрос со списком id, переданным одним параметром."""
+    if connections[using].vendor == 'postgresql':
+        return RawSQL('SELECT unnest(%s::bigint[])', (ids,))
+    return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(ids),))
+
+
+def filter_by_ingredients(queryset, include=(), exclude=(), available=None,
+                          max_missing=0):
+    if not include and available is None:
+        # одни исключения отбирают почти всё, это обычный anti-join
+        return filter_by_ingredients_sql(queryset, exclude=exclude)
+    ids = ingredient_set_index.match(include, exclude, available, max_missing)
+    if not len(ids):
+        return queryset.none()
+    if len(ids) > MAX_ID_LIST:
+        return filter_by_ingredients_sql(
+            queryset, include, exclude, available, max_missing
+        )
+    return queryset.filter(pk__in=id_list(ids.tolist(), queryset.db))
@@ -0,0 +1,152 @@
+import secrets
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ingredients.models import Ingredient, RecipeIngredient
+from recipes.ingredient_sets import (IngredientSetIndex,
+                                     filter_by_ingredients_sql)
+from recipes.models import Recipe
+
+User = get_user_model()
+
+SEED_CHUNK = 10000
+
+
+def seed(recipes, ingredients, per_recipe, rng):
+    """Рецепты со «скошенной» популярностью ингредиентов, как в жизни."""
+    # случайное имя не столкнётся с настоящим пользователем
+    name = f'bench-{secrets.token_hex(8)}'
+    author = User.objects.create(
+        email=f'{name}@example.com', username=name, first_name='bench',
+        last_name='bench', password='!'
+    )
+    ingredient_ids = np.array([
+        ingredient.pk for ingredient in Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench{i}', measurement_unit='г')
+            for i in range(ingredients)
+        )
+    ])
+    weights = 1 / np.arange(1, ingredients + 1)
+    weights /= weights.sum()
+    for start in range(0, recipes, SEED_CHUNK):
+        chunk = Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'bench{i}', image='recipes/bench.png',
+                text='bench', cooking_time=5
+            )
+            for i in range(start, min(start + SEED_CHUNK, recipes))
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=1)
+            for recipe in chunk
+            for pk in rng.choice(
+                ingredient_ids, rng.integers(2, 2 * per_recipe - 1),
+                replace=False, p=weights
+            ).tolist()
+        )
+    return ingredient_ids, weights
+
+
+def make_queries(ingredient_ids, weights, count, rng):
+    def pick(size):
+        return rng.choice(
+            ingredient_ids, size, replace=False, p=weights
+        ).tolist()
+
+    queries = []
+    for _ in range(count):
+        queries += [
+            ('include', {'include': pick(2)}),
+            ('include+exclude', {'include': pick(1), 'exclude': pick(3)}),
+            ('available', {'available': pick(25), 'max_missing': 2}),
+        ]
+    return queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare include/exclude/max-missing ingredient filters: '
+        'SQL vs in-memory bitmap index (seeded data is rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--per-recipe', type=int, default=8,
+            help='Average number of ingredients per recipe'
+        )
+        parser.add_argument(
+            '--queries', type=int, default=10,
+            help='Queries of each kind'
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        with transaction.atomic():
+            started = time.perf_counter()
+            ingredient_ids, weights = seed(
+                options['recipes'], options['ingredients'],
+                options['per_recipe'], rng
+            )
+            self.stdout.write(
+                f'Данные: {time.perf_counter() - started:.1f} с'
+            )
+            try:
+                self.bench(make_queries(
+                    ingredient_ids, weights, options['queries'], rng
+                ))
+            finally:
+                # автор, ингредиенты и рецепты замера не остаются в базе
+                transaction.set_rollback(True)
+
+    def bench(self, queries):
+        index = IngredientSetIndex()
+        started = time.perf_counter()
+        index.match()
+        build_time = time.perf_counter() - started
+
+        def sql_match(**query):
+            return list(filter_by_ingredients_sql(
+                Recipe.objects.order_by(), **query
+            ).values_list('pk', flat=True))
+
+        timings = {}
+        mismatches = 0
+        for kind, query in queries:
+            started = time.perf_counter()
+            expected = sql_match(**query)
+            sql_time = time.perf_counter() - started
+            started = time.perf_counter()
+            found = index.match(**query)
+            index_time = time.perf_counter() - started
+            mismatches += set(expected) != set(found.tolist())
+            total = timings.setdefault(kind, [0, 0, 0, 0])
+            total[0] += sql_time
+            total[1] += index_time
+            total[2] += 1
+            total[3] += len(found)
+
+        for kind, (sql_time, index_time, calls, found) in timings.items():
+            self.stdout.write(
+                f'{kind:>16}: sql {sql_time * 1000 / calls:.2f} мс, '
+                f'индекс {index_time * 1000 / calls:.2f} мс, '
+                f'x{sql_time / index_time:.1f} '
+                f'(в среднем {found // calls} рецептов)'
+            )
+        self.stdout.write(
+            f'Построение индекса: {build_time * 1000:.0f} мс, '
+            f'матрица {index._bits.nbytes / 2 ** 20:.1f} МБ'
+        )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Расхождений с SQL: {mismatches}.'
+            ))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS('Результаты совпадают с SQL.')
+            )
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.images import build_variants, variants_outdated
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Build missing image variants for recipes and avatars'
+
+    def handle(self, *args, **options):
+        built = 0
+        for model, field_name, variants_field in (
+            (Recipe, 'image', 'image_variants'),
+            (User, 'avatar', 'avatar_variants'),
+        ):
+            for instance in model.objects.only(
+                'pk', field_name, variants_field
+            ).iterator():
+                if not variants_outdated(
+                    getattr(instance, field_name),
+                    getattr(instance, variants_field)
+                ):
+                    continue
+                try:
+                    build_variants(
+                        model._meta.label, instance.pk, field_name,
+                        variants_field, getattr(instance, field_name).name
+                    )
+                except OSError as error:
+                    self.stderr.write(
+                        f'{model._meta.label} {instance.pk}: {error}'
+                    )
+                    continue
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Построены варианты для изображений: {built}.'
+        ))
@@ -0,0 +1,160 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ingredients.models import Ingredient, RecipeIngredient
+from recipes.models import Favorite, Recipe, ShoppingListItem
+from recipes.search import search_recipes
+from recipes.timeline import followed_timeline
+from recipes.trending import order_by_score
+from users.models import Follow
+
+User = get_user_model()
+
+# "Seq Scan on t" у PostgreSQL, "SCAN t" без "USING INDEX" у SQLite
+SEQ_SCAN = re.compile(
+    r'Seq Scan on (\w+)|\bSCAN (?!CONSTANT\b)(\w+)\b(?! USING)'
+)
+
+
+def seed(size):
+    """Данные для планировщика; откатываются вместе с транзакцией."""
+    authors = User.objects.bulk_create(
+        User(
+            email=f'plan{i}@example.com', username=f'plan{i}',
+            first_name='plan', last_name='plan', password='!'
+        )
+        for i in range(max(size // 10, 2))
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'plan{i}', measurement_unit='г')
+        for i in range(200)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=authors[i % len(authors)], name=f'plan{i}',
+            image='recipes/plan.png', text='plan', cooking_time=5
+        )
+        for i in range(size)
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, ingredient=ingredients[(i + j) % 200], amount=1
+        )
+        for i, recipe in enumerate(recipes) for j in range(5)
+    )
+    Favorite.objects.bulk_create(
+        Favorite(user=authors[i % len(authors)], recipe=recipe)
+        for i, recipe in enumerate(recipes[::3])
+    )
+    Recipe.shopping_cart.through.objects.bulk_create(
+        Recipe.shopping_cart.through(
+            user=authors[i % len(authors)], recipe=recipe
+        )
+        for i, recipe in enumerate(recipes[1::3])
+    )
+    Follow.objects.bulk_create(
+        Follow(user=author, following=authors[(i + 1) % len(authors)])
+        for i, author in enumerate(authors)
+    )
+
+
+def endpoint_queries(user, recipe, author):
+    """Основные запросы эндпоинтов API (без COUNT пагинации)."""
+    recipes = Recipe.objects.for_read(user)
+    return [
+        ('GET /api/recipes/', recipes[:6]),
+        ('GET /api/recipes/?author=', recipes.filter(author=author)[:6]),
+        ('GET /api/recipes/?is_favorited=1',
+         recipes.filter(is_favorited=True)[:6]),
+        ('GET /api/recipes/?is_in_shopping_cart=1',
+         recipes.filter(is_in_shopping_cart=True)[:6]),
+        ('GET /api/recipes/?search=',
+         search_recipes(recipes, recipe.name)[:6]),
+        ('GET /api/recipes/?ordering=trending',
+         order_by_score(recipes, 'trending')[:6]),
+        ('GET /api/recipes/timeline/', followed_timeline(user)[:6]),
+        ('GET /api/recipes/{id}/', recipes.filter(pk=recipe.pk)),
+        ('GET /api/recipes/ (ингредиенты)',
+         RecipeIngredient.objects.select_related('ingredient').filter(
+             recipe_id__in=[recipe.pk]
+         )),
+        ('POST /api/recipes/{id}/favorite/',
+         Favorite.objects.filter(user=user, recipe=recipe)),
+        ('POST /api/recipes/{id}/shopping_cart/',
+         Recipe.shopping_cart.through.objects.filter(
+             user=user, recipe=recipe
+         )),
+        ('GET /api/recipes/download_shopping_cart/',
+         ShoppingListItem.objects.filter(user=user)),
+        ('GET /api/users/', User.objects.with_is_subscribed(user)[:10]),
+        ('POST /api/users/{id}/subscribe/',
+         Follow.objects.filter(user=user, following=author)),
+        ('GET /api/users/subscriptions/',
+         User.objects.filter(following__user=user).order_by('email')[:10]),
+        ('GET /api/users/subscriptions/ (рецепты)',
+         Recipe.objects.filter(author_id__in=[author.pk])),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queries behind the API endpoints and flag seq scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='Seed this many recipes (rolled back afterwards)'
+        )
+        parser.add_argument(
+            '--allow', action='append', default=[], metavar='TABLE',
+            help='Table where a sequential scan is acceptable (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                seed(options['seed'])
+            if connection.vendor == 'postgresql':
+                # на маленьких таблицах seq scan дешевле индекса, поэтому
+                # проверяем, есть ли у планировщика вообще индексный путь
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            flagged = self.check_plans(
+                set(options['allow']), options['verbosity'] > 1
+            )
+            transaction.set_rollback(True)
+
+        if flagged:
+            raise CommandError(
+                f'Последовательное чтение в запросах: {len(flagged)}.'
+            )
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
+
+    def check_plans(self, allowed, verbose):
+        user = User.objects.filter(follower__isnull=False).first()
+        recipe = Recipe.objects.first()
+        if user is None or recipe is None:
+            raise CommandError(
+                'Нет данных для планов запросов, запустите с --seed.'
+            )
+        author = user.follower.first().following
+
+        flagged = []
+        for name, queryset in endpoint_queries(user, recipe, author):
+            plan = queryset.explain()
+            tables = {
+                table for match in SEQ_SCAN.finditer(plan)
+                for table in match.groups() if table
+            } - allowed
+            if tables:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: seq scan по {", ".join(sorted(tables))}'
+                ))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if verbose or tables:
+                self.stdout.write(plan)
+        return flagged
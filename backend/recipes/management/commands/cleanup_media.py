@@ -0,0 +1,88 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+# (модель, поле файла, JSON-поле вариантов)
+MEDIA_FIELDS = (
+    (Recipe, 'image', 'image_variants'),
+    (User, 'avatar', 'avatar_variants'),
+)
+
+
+def media_references():
+    """Сколько раз на каждый файл ссылаются объекты и их варианты."""
+    references = Counter()
+    for model, field_name, variants_field in MEDIA_FIELDS:
+        rows = model.objects.exclude(**{field_name: ''}).exclude(
+            **{f'{field_name}__isnull': True}
+        ).values_list(field_name, variants_field)
+        for name, variants in rows.iterator():
+            references[name] += 1
+            # варианты от прежнего изображения никому не нужны
+            if variants.get('source') == name:
+                references.update(
+                    value for key, value in variants.items()
+                    if key != 'source'
+                )
+    return references
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for child in directories:
+        yield from walk(storage, posixpath.join(directory, child))
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that no recipe or user references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the files that would be deleted'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60, metavar='MINUTES',
+            help='Keep files younger than this (uploads not committed yet)'
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        references = media_references()
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        directories = {
+            model._meta.get_field(field_name).upload_to.rstrip('/')
+            for model, field_name, _ in MEDIA_FIELDS
+        }
+
+        removed = size = 0
+        for directory in sorted(directories):
+            if not storage.exists(directory):
+                continue
+            for name in walk(storage, directory):
+                if references[name]:
+                    continue
+                if storage.get_modified_time(name) > threshold:
+                    continue
+                removed += 1
+                size += storage.size(name)
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed} ({size / 2 ** 20:.1f} МБ).'
+        ))
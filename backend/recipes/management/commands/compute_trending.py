@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from recipes.trending import HALF_LIFE, WINDOW, compute_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute trending and popular recipe scores '
+        '(run periodically, e.g. from cron every 15 minutes)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float,
+            default=HALF_LIFE.total_seconds() / 3600, metavar='HOURS',
+            help='Hours after which an event weighs half as much'
+        )
+        parser.add_argument(
+            '--window', type=float, default=WINDOW.days, metavar='DAYS',
+            help='Ignore favorites and cart additions older than this'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = compute_scores(
+            half_life=timedelta(hours=options['half_life']),
+            window=timedelta(days=options['window'])
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Рецептов в рейтинге: {count}, '
+            f'{time.perf_counter() - started:.1f} с.'
+        ))
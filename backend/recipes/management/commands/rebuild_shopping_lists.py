@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import Recipe, ShoppingListItem
+from recipes.shopping_list import cart_totals, write_totals
+
+
+class Command(BaseCommand):
+    help = 'Verify and rebuild materialized shopping lists from carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report users whose shopping list has drifted'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Limit to the given user id (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        carts = Recipe.shopping_cart.through.objects.all()
+        items = ShoppingListItem.objects.all()
+        if options['users']:
+            carts = carts.filter(user_id__in=options['users'])
+            items = items.filter(user_id__in=options['users'])
+        user_ids = set(carts.values_list('user_id', flat=True))
+        user_ids |= set(items.values_list('user_id', flat=True))
+
+        with transaction.atomic():
+            items = list(items.select_for_update())
+            totals = cart_totals(user_ids)
+            stored = {
+                (item.user_id, item.ingredient_id): item.total_amount
+                for item in items
+            }
+            drifted = sorted({
+                user_id for user_id, _ in stored.keys() ^ totals.keys()
+            } | {
+                key[0] for key, total in totals.items()
+                if stored.get(key, total) != total
+            })
+            if drifted:
+                self.stdout.write(self.style.WARNING(
+                    'Расхождения у пользователей: '
+                    + ', '.join(map(str, drifted))
+                ))
+            if options['check']:
+                if drifted:
+                    raise CommandError(
+                        f'Списки покупок расходятся: {len(drifted)}.'
+                    )
+                self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+                return
+            write_totals(items, totals)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Пересчитано пользователей: {len(user_ids)}, '
+            f'исправлено: {len(drifted)}.'
+        ))
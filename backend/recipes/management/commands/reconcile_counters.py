@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import counter_definitions
+
+
+class Command(BaseCommand):
+    help = 'Verify and repair denormalized recipe and user counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report counters that have drifted'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for model, field, actual in counter_definitions():
+                drifted = list(
+                    model.objects.annotate(actual=actual)
+                    .exclude(**{field: F('actual')})
+                    .values_list('pk', flat=True)
+                )
+                if not drifted:
+                    continue
+                total += len(drifted)
+                self.stdout.write(self.style.WARNING(
+                    f'{model._meta.label}.{field}: '
+                    f'расхождений {len(drifted)}'
+                ))
+                if not options['check']:
+                    model.objects.filter(pk__in=drifted).update(
+                        **{field: actual}
+                    )
+
+        if options['check']:
+            if total:
+                raise CommandError(f'Счётчики расходятся: {total}.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Исправлено счётчиков: {total}.'
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_favorites(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    affected = set()
+    duplicates = Favorite.objects.values('user', 'recipe').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in duplicates:
+        Favorite.objects.filter(
+            user_id=group['user'], recipe_id=group['recipe']
+        ).exclude(pk=group['keep']).delete()
+        affected.add(group['recipe'])
+
+    Recipe.objects.filter(pk__in=affected).update(favorites_count=Coalesce(
+        Subquery(
+            Favorite.objects.filter(recipe=OuterRef('pk')).order_by()
+            .values('recipe').annotate(total=Count('pk')).values('total')
+        ), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0005_unique_recipe_ingredient'),
+        ('recipes', '0004_recipe_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_favorites, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created_at', '-id'], name='recipe_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created_at'], name='recipe_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at'], name='recipe_updated_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+import recipes.models
+
+
+def fill_short_codes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    used = set()
+    rows = list(Recipe.objects.filter(short_code__isnull=True).only('pk'))
+    for recipe in rows:
+        code = recipes.models.generate_short_code()
+        while code in used:
+            code = recipes.models.generate_short_code()
+        used.add(code)
+        recipe.short_code = code
+    Recipe.objects.bulk_update(rows, ['short_code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(editable=False, max_length=7, null=True, verbose_name='Код короткой ссылки'),
+        ),
+        migrations.RunPython(fill_short_codes, migrations.RunPython.noop),
+    ]
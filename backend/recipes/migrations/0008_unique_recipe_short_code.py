@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_short_code'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(default=recipes.models.generate_short_code, editable=False, max_length=7, unique=True, verbose_name='Код короткой ссылки'),
+        ),
+    ]
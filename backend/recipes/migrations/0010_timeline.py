@@ -0,0 +1,97 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import recipes.timeline
+
+
+def fan_out_existing(apps, schema_editor):
+    # как при подписке: в ленты попадают последние рецепты автора
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    Follow = apps.get_model('users', 'Follow')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    authors = User.objects.filter(
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+    ).values('pk')
+    Recipe.objects.filter(author__in=authors).update(fanned_out=True)
+    for user_id, author_id in Follow.objects.filter(
+        following__in=authors
+    ).values_list('user_id', 'following_id').iterator():
+        rows = Recipe.objects.filter(author_id=author_id).order_by(
+            '-created_at', '-id'
+        ).values_list('pk', 'created_at')
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, created_at=created_at
+                )
+                for recipe_id, created_at in
+                rows[:recipes.timeline.TIMELINE_BACKFILL]
+            ],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0005_unique_recipe_ingredient'),
+        ('recipes', '0009_recipe_search_vector'),
+        ('users', '0003_user_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания рецепта')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Разослан в ленты подписчиков'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-created_at'], name='recipe_not_fanned_out_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-recipe'], name='timeline_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fan_out_existing, migrations.RunPython.noop),
+    ]
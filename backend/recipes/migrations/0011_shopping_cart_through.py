@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def stamp_existing_cart_items(apps, schema_editor):
+    # когда рецепты попали в корзины, неизвестно; самая ранняя возможная
+    # дата - создание рецепта, на тренды такие строки почти не влияют
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart.objects.filter(created_at__isnull=True).update(
+        created_at=Subquery(
+            Recipe.objects.filter(pk=OuterRef('recipe_id')).values(
+                'created_at'
+            )
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timeline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # таблица автоматической промежуточной модели остаётся как есть,
+        # меняется только описание модели в состоянии миграций
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ShoppingCart',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='recipes.recipe', verbose_name='Рецепт')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                    ],
+                    options={
+                        'verbose_name': 'Рецепт в списке покупок',
+                        'verbose_name_plural': 'Рецепты в списках покупок',
+                        'db_table': 'recipes_recipe_shopping_cart',
+                        'unique_together': {('recipe', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='shopping_cart',
+                    field=models.ManyToManyField(blank=True, related_name='cart_recipes', through='recipes.ShoppingCart', to=settings.AUTH_USER_MODEL, verbose_name='В списке покупок у пользователей'),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created_at',
+            field=models.DateTimeField(null=True, verbose_name='Дата добавления в список покупок'),
+        ),
+        migrations.RunPython(
+            stamp_existing_cart_items, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipescore',
+            name='computed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время пересчёта'),
+        ),
+    ]
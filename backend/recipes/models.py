@@ -1,14 +1,56 @@
+import secrets
+import string
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
-from ingredients.models import Ingredient
+from ingredients.models import Ingredient, RecipeIngredient
 
 User = get_user_model()
 
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
 
+SHORT_CODE_ALPHABET = string.ascii_letters + string.digits
+SHORT_CODE_LENGTH = 7
+
+
+def generate_short_code():
+    return ''.join(
+        secrets.choice(SHORT_CODE_ALPHABET) for _ in range(SHORT_CODE_LENGTH)
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(
+                Recipe.shopping_cart.through.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )
+            )
+        )
+
+    def for_read(self, user):
+        return self.with_user_flags(user).prefetch_related(
+            Prefetch('author', queryset=User.objects.with_is_subscribed(user)),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -25,6 +67,19 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Изображение рецепта'
     )
+    short_code = models.CharField(
+        max_length=SHORT_CODE_LENGTH,
+        unique=True,
+        editable=False,
+        default=generate_short_code,
+        verbose_name='Код короткой ссылки'
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения'
+    )
     text = models.TextField(
         verbose_name='Описание рецепта'
     )
@@ -37,6 +92,7 @@ class Recipe(models.Model):
     )
     shopping_cart = models.ManyToManyField(
         User,
+        through='ShoppingCart',
         related_name='cart_recipes',
         blank=True,
         verbose_name='В списке покупок у пользователей'
@@ -55,11 +111,50 @@ class Recipe(models.Model):
         auto_now=True,
         verbose_name='Дата обновления'
     )
+    # заполняется recipes.search.refresh_search_vectors, только PostgreSQL
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    # разослан ли рецепт в TimelineEntry подписчиков при создании;
+    # остальные лента подписок читает из Recipe, см. recipes.timeline
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан в ленты подписчиков'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'], name='recipe_created_at_idx'
+            ),
+            models.Index(
+                fields=['author', '-created_at'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(fields=['updated_at'], name='recipe_updated_at_idx'),
+            models.Index(
+                fields=['author', '-created_at'],
+                condition=models.Q(fanned_out=False),
+                name='recipe_not_fanned_out_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} (автор: {self.author.username})'
@@ -86,6 +181,163 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} -> {self.recipe.name}'
+
+
+class ShoppingCart(models.Model):
+    """Рецепт в корзине пользователя (промежуточная модель shopping_cart)."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Рецепт'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Пользователь'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата добавления в список покупок',
+        default=timezone.now
+    )
+
+    class Meta:
+        # таблица бывшей автоматической промежуточной модели
+        db_table = 'recipes_recipe_shopping_cart'
+        verbose_name = 'Рецепт в списке покупок'
+        verbose_name_plural = 'Рецепты в списках покупок'
+        unique_together = [('recipe', 'user')]
+
+    def __str__(self):
+        return f'{self.user} -> {self.recipe_id}'
+
+
+class RecipeScore(models.Model):
+    """Рейтинг рецепта, пересчитывается командой compute_trending."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    trending = models.FloatField(verbose_name='В тренде')
+    popular = models.FloatField(verbose_name='Популярность')
+    # одно на все строки пересчёта: по нему выдачи узнают о новом рейтинге
+    computed_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Время пересчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=['-trending'], name='recipe_score_trending_idx'
+            ),
+            models.Index(
+                fields=['-popular'], name='recipe_score_popular_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.trending:.2f} / {self.popular:.0f}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт автора в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    # копии полей рецепта: сортировка и очистка без join
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-recipe'],
+                name='timeline_user_created_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe_id}'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента по всем рецептам в корзине.
+
+    Поддерживается recipes.shopping_list.refresh_shopping_lists при
+    изменении корзины и состава рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
 
     def __str__(self):
-        return f'{self.user.username} -> {self.recipe.name}'
\ No newline at end of file
+        return f'{self.user} - {self.ingredient}: {self.total_amount}'
@@ -0,0 +1,140 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+В PostgreSQL поиск идёт по полю Recipe.search_vector (tsvector с
+GIN-индексом), которое обновляется refresh_search_vectors. На других БД
+(SQLite в тестах и локальной разработке) используется инвертированный
+индекс в памяти процесса, перестраиваемый по версии SEARCH_VERSION.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery, Value,
+                              When)
+
+from api.versions import bump_version_on_commit, get_version
+from ingredients.models import RecipeIngredient
+
+from .models import Recipe
+
+SEARCH_VERSION = 'recipe-search'
+SEARCH_CONFIG = 'russian'
+# максимум результатов запасного индекса, дальше релевантность уже мала
+FALLBACK_LIMIT = 1000
+
+TOKEN = re.compile(r'\w+')
+# веса как у ts_rank по умолчанию для A, B и C
+NAME_WEIGHT = 1.0
+INGREDIENT_WEIGHT = 0.4
+TEXT_WEIGHT = 0.2
+
+
+def use_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression():
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(recipe_ids):
+    """Пересчитать поисковые данные рецептов (id или queryset id)."""
+    if use_search_vector():
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_vector_expression()
+        )
+    else:
+        bump_version_on_commit(SEARCH_VERSION)
+
+
+def tokenize(text):
+    return [token.casefold() for token in TOKEN.findall(text)]
+
+
+class RecipeSearchIndex:
+    """Инвертированный индекс: слово -> {id рецепта: вес}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+
+    def _build(self, version):
+        postings = defaultdict(Counter)
+        for recipe in Recipe.objects.values('id', 'name', 'text').iterator():
+            for token in tokenize(recipe['name']):
+                postings[token][recipe['id']] += NAME_WEIGHT
+            for token in tokenize(recipe['text']):
+                postings[token][recipe['id']] += TEXT_WEIGHT
+        for row in RecipeIngredient.objects.values(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            for token in tokenize(row['ingredient__name']):
+                postings[token][row['recipe_id']] += INGREDIENT_WEIGHT
+        self._postings = dict(postings)
+        self._version = version
+
+    def _ensure_fresh(self):
+        version = get_version(SEARCH_VERSION)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build(version)
+
+    def search(self, query, limit=FALLBACK_LIMIT):
+        """Пары (id, релевантность) рецептов, где есть все слова запроса."""
+        self._ensure_fresh()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        matches = [self._postings.get(term, {}) for term in terms]
+        ids = set.intersection(*(set(match) for match in matches))
+        ranked = sorted(
+            ((recipe_id, sum(match[recipe_id] for match in matches))
+             for recipe_id in ids),
+            key=lambda item: (-item[1], -item[0])
+        )
+        return ranked[:limit]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Отфильтровать queryset по запросу и упорядочить по релевантности."""
+    if use_search_vector():
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at', '-id')
+
+    ranked = recipe_search_index.search(query)
+    if not ranked:
+        return queryset.none()
+    ids = [recipe_id for recipe_id, _ in ranked]
+    return queryset.filter(pk__in=ids).annotate(
+        rank=Case(
+            *(
+                When(pk=recipe_id, then=Value(rank))
+                for recipe_id, rank in ranked
+            ),
+            output_field=FloatField()
+        )
+    ).order_by('-rank', '-created_at', '-id')
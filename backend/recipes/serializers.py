@@ -1,8 +1,17 @@
+import json
+
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import QueryDict
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
+from api.fields import ImageUploadField
+from api.images import variant_urls
+from api.relations import delete_rows
 from ingredients.models import Ingredient, RecipeIngredient
 from users.serializers import UserSerializer
+from .cache import get_shared_payloads
 from .models import Recipe
+from .signals import recipe_ingredients_changed, replacing_composition
 
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
@@ -10,6 +19,8 @@ MAX_COOKING_TIME = 32000
 MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 32000
 
+MAX_BATCH_SIZE = 500
+
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
@@ -24,21 +35,20 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class IngredientReadSerializer(serializers.ModelSerializer):
-    amount = serializers.SerializerMethodField()
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
 
     class Meta:
-        model = Ingredient
+        model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
-    def get_amount(self, obj):
-        recipe = self.context['recipe']
-        recipe_ingredient = obj.ingredient_recipes.filter(recipe=recipe).first()
-        return recipe_ingredient.amount if recipe_ingredient else None
-
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IngredientInRecipeSerializer(many=True)
-    image = Base64ImageField()
+    image = ImageUploadField()
     name = serializers.CharField(max_length=256)
     cooking_time = serializers.IntegerField(
         min_value=MIN_COOKING_TIME,
@@ -49,6 +59,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'ingredients', 'image', 'name', 'text', 'cooking_time')
 
+    def to_internal_value(self, data):
+        # в multipart ингредиенты приходят JSON-строкой рядом с файлом
+        if isinstance(data, QueryDict):
+            data = data.dict()
+            if isinstance(data.get('ingredients'), str):
+                try:
+                    data['ingredients'] = json.loads(data['ingredients'])
+                except ValueError:
+                    raise serializers.ValidationError({
+                        'ingredients': 'Некорректный JSON.'
+                    })
+        return super().to_internal_value(data)
+
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError(
@@ -87,17 +110,25 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             })
         return data
 
-    def create_ingredients(self, recipe, ingredients_data):
+    def create_ingredients(self, recipe, ingredients_data, removed_ids=()):
         bulk = [
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=item['id']),
+                ingredient_id=item['id'],
                 amount=item['amount']
             )
             for item in ingredients_data
         ]
         RecipeIngredient.objects.bulk_create(bulk)
+        recipe_ingredients_changed.send(
+            sender=Recipe,
+            recipe_id=recipe.pk,
+            ingredient_ids=[
+                *removed_ids, *(item['id'] for item in ingredients_data)
+            ]
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(
@@ -106,54 +137,176 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
 
+        if ingredients is not None:
+            # один DELETE ... RETURNING вместо удаления по строке; о замене
+            # состава create_ingredients сообщит одним сигналом
+            with replacing_composition():
+                removed = delete_rows(RecipeIngredient, recipe=instance.pk)
+            self.create_ingredients(
+                instance, ingredients,
+                [row.ingredient_id for row in removed]
+            )
+
+        # сохраняем после ингредиентов, чтобы updated_at (а с ним и ключ
+        # кэша) сменился уже после замены состава
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
 
-        if ingredients is not None:
-            RecipeIngredient.objects.filter(recipe=instance).delete()
-            self.create_ingredients(instance, ingredients)
-
         return instance
 
     def to_representation(self, instance):
+        # после update DRF сбрасывает prefetch, а без него ингредиенты
+        # ответа читались бы по одному
+        prefetch_related_objects([instance], Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ))
         return RecipeReadSerializer(instance, context=self.context).data
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin:
+    def get_image_variants(self, obj):
+        return variant_urls(
+            obj.image, obj.image_variants, self.context.get('request')
+        )
+
+
+class RecipePayloadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    """Общая для всех пользователей часть RecipeReadSerializer."""
+
+    ingredients = IngredientReadSerializer(
+        source='recipe_ingredients',
+        many=True,
+        read_only=True
+    )
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'ingredients', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
+        )
+
+
+def absolute_urls(request, urls):
+    if urls is None:
+        return None
+    return {
+        name: request.build_absolute_uri(url) for name, url in urls.items()
+    }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        recipes = list(data)
+        payloads = get_shared_payloads(
+            recipes,
+            self.child.build_recipe_payload,
+            self.child.build_author_payload
+        )
+        return [
+            self.child.personalize(recipe, *payload)
+            for recipe, payload in zip(recipes, payloads)
+        ]
+
+
+class RecipeReadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = IngredientReadSerializer(
+        source='recipe_ingredients',
+        many=True,
+        read_only=True
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_ingredients(self, obj):
-        serializer = IngredientReadSerializer(
-            obj.ingredients.all(),
-            many=True,
-            context={'recipe': obj}
+    def to_representation(self, instance):
+        [payload] = get_shared_payloads(
+            [instance], self.build_recipe_payload, self.build_author_payload
         )
-        return serializer.data
+        return self.personalize(instance, *payload)
+
+    # без request в контексте изображения сериализуются относительными
+    # ссылками, поэтому payload не зависит от хоста запроса
+    def build_recipe_payload(self, instance):
+        return RecipePayloadSerializer(instance).data
+
+    def build_author_payload(self, author):
+        return UserSerializer(author).data
 
+    def personalize(self, instance, recipe_payload, author_payload):
+        request = self.context['request']
+        author = dict(author_payload)
+        author['is_subscribed'] = self.fields['author'].get_is_subscribed(
+            instance.author
+        )
+        if author['avatar']:
+            author['avatar'] = request.build_absolute_uri(author['avatar'])
+            author['avatar_variants'] = absolute_urls(
+                request, author['avatar_variants']
+            )
+        return {
+            'id': recipe_payload['id'],
+            'author': author,
+            'ingredients': recipe_payload['ingredients'],
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'name': recipe_payload['name'],
+            'image': request.build_absolute_uri(recipe_payload['image']),
+            'image_variants': absolute_urls(
+                request, recipe_payload['image_variants']
+            ),
+            'text': recipe_payload['text'],
+            'cooking_time': recipe_payload['cooking_time'],
+        }
+
+    # флаги аннотируются в RecipeQuerySet.with_user_flags
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return user.is_authenticated and obj.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return user.is_authenticated and obj.shopping_cart.filter(id=user.id).exists()
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
+
+    def validate_recipes(self, value):
+        # повторы убираем, порядок ответа - как в запросе
+        return list(dict.fromkeys(value))
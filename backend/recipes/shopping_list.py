@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from api.versions import bump_version_on_commit, get_versions
+from ingredients.models import RecipeIngredient
+from ingredients.search import INDEX_VERSION
+
+from .models import ShoppingListItem
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_CACHE_TIMEOUT = 60 * 60
+# списки больше этого не кэшируем, чтобы не держать их целиком в памяти
+EXPORT_CACHE_MAX_SIZE = 256 * 1024
+
+
+def cart_version(user_id):
+    return f'cart:{user_id}'
+
+
+def cart_totals(user_ids, ingredient_ids=None):
+    """Суммы из корзин, посчитанные заново по RecipeIngredient."""
+    queryset = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__in=user_ids
+    )
+    if ingredient_ids is not None:
+        queryset = queryset.filter(ingredient_id__in=ingredient_ids)
+    return {
+        (row['user_id'], row['ingredient_id']): row['total']
+        for row in queryset.values(
+            'ingredient_id', user_id=F('recipe__shopping_cart')
+        ).annotate(total=Sum('amount')).order_by()
+    }
+
+
+def write_totals(items, totals):
+    """Привести строки items к totals: обновить, добавить, удалить."""
+    stale = [
+        item.pk for item in items
+        if (item.user_id, item.ingredient_id) not in totals
+    ]
+    if stale:
+        ShoppingListItem.objects.filter(pk__in=stale).delete()
+    if totals:
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total
+                )
+                for (user_id, ingredient_id), total in totals.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'ingredient'],
+            update_fields=['total_amount']
+        )
+
+
+def refresh_shopping_lists(user_ids, ingredient_ids):
+    """Пересчитать строки списков покупок для пар (пользователь, ингредиент).
+
+    Вызывается при добавлении/удалении рецептов из корзины и при правке
+    состава рецептов, лежащих в чьей-то корзине.
+    """
+    user_ids, ingredient_ids = set(user_ids), set(ingredient_ids)
+    if not user_ids:
+        return
+    bump_version_on_commit(*map(cart_version, user_ids))
+    if not ingredient_ids:
+        return
+    with transaction.atomic():
+        items = list(ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=ingredient_ids
+        ))
+        write_totals(items, cart_totals(user_ids, ingredient_ids))
+
+
+def shopping_list_rows(user):
+    return ShoppingListItem.objects.filter(user=user).values(
+        'total_amount',
+        name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit')
+    ).order_by('name').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def render_txt(rows):
+    yield 'Список покупок:\n'
+    for item in rows:
+        yield f"{item['name']} ({item['unit']}) — {item['total_amount']}\n"
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(*values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line('name', 'measurement_unit', 'amount')
+    for item in rows:
+        yield line(item['name'], item['unit'], item['total_amount'])
+
+
+def render_json(rows):
+    separator = '[\n'
+    for item in rows:
+        yield separator + json.dumps({
+            'name': item['name'],
+            'measurement_unit': item['unit'],
+            'amount': item['total_amount'],
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]' if separator == '[\n' else '\n]'
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json; charset=utf-8', render_json),
+}
+
+
+def export_cache_key(user, export_format):
+    # версия корзины меняется при каждом пересчёте списка покупок
+    stamps = get_versions(cart_version(user.pk), INDEX_VERSION)
+    return (
+        f'shopping-list:{user.pk}:{export_format}:'
+        f'{":".join(map(str, stamps))}'
+    )
+
+
+def export_shopping_list(user, export_format):
+    """Куски выгрузки списка покупок в нужном формате.
+
+    Строки читаются курсором по мере отправки ответа; небольшие выгрузки
+    кэшируются по версии корзины.
+    """
+    key = export_cache_key(user, export_format)
+    rendered = cache.get(key)
+    if rendered is not None:
+        yield rendered
+        return
+
+    render = EXPORT_FORMATS[export_format][1]
+    chunks, size = [], 0
+    for chunk in render(shopping_list_rows(user)):
+        if chunks is not None:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > EXPORT_CACHE_MAX_SIZE:
+                chunks = None
+        yield chunk
+    if chunks is not None:
+        cache.set(key, ''.join(chunks), EXPORT_CACHE_TIMEOUT)
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .models import Recipe
+
+SHORT_LINK_CACHE_SIZE = 10000
+SHORT_LINK_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class LRUCache:
+    """Небольшой потокобезопасный LRU-словарь в памяти процесса."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_local_cache = LRUCache(SHORT_LINK_CACHE_SIZE)
+
+
+def short_link_key(code):
+    return f'short-link:{code}'
+
+
+def resolve_short_code(code):
+    """Id рецепта по коду короткой ссылки или None.
+
+    Код рецепта не меняется, поэтому найденное значение можно держать
+    в кэше, пока рецепт не удалён (см. forget_short_code): сначала
+    память процесса, затем общий кэш, и только потом БД. Несуществующие
+    коды не кэшируются.
+    """
+    recipe_id = _local_cache.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    recipe_id = cache.get(short_link_key(code))
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(short_code=code).values_list(
+            'pk', flat=True
+        ).first()
+        if recipe_id is None:
+            return None
+        cache.set(short_link_key(code), recipe_id, SHORT_LINK_TIMEOUT)
+    _local_cache.set(code, recipe_id)
+    return recipe_id
+
+
+def forget_short_code(code):
+    """Убрать код удалённого рецепта из кэша этого процесса и общего.
+
+    В памяти других процессов код доживает до вытеснения, но ведёт на
+    страницу уже несуществующего рецепта.
+    """
+    _local_cache.delete(code)
+    cache.delete(short_link_key(code))
@@ -0,0 +1,291 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from api.images import schedule_variants, variants_outdated
+from api.versions import bump_version_on_commit
+from ingredients.models import Ingredient, RecipeIngredient
+from users.models import Follow
+
+from .cache import invalidate_author_payload
+from .counters import adjust_counter
+from .ingredient_sets import schedule_sync
+from .models import Favorite, Recipe
+from .search import refresh_search_vectors
+from .shopping_list import refresh_shopping_lists
+from .shortlinks import forget_short_code
+from .timeline import backfill, clear, fan_out, should_fan_out
+
+User = get_user_model()
+
+# вход и смена пароля не меняют того, что видно в выдаче рецептов
+PRIVATE_USER_FIELDS = frozenset({'last_login', 'password'})
+
+# отправляется с recipe_id и ingredient_ids при изменении состава рецепта,
+# в том числе после bulk_create, который не шлёт post_save
+recipe_ingredients_changed = Signal()
+
+_composition = threading.local()
+
+
+def author_version(author_id):
+    # меняется вместе с данными автора в выдаче его рецептов
+    return f'author:{author_id}'
+
+
+def user_flags_version(user_id):
+    # меняется, когда у пользователя меняются is_favorited,
+    # is_in_shopping_cart или is_subscribed в выдаче рецептов
+    return f'user-flags:{user_id}'
+
+
+def cart_ingredient_ids(recipe_ids):
+    return set(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', flat=True))
+
+
+@contextmanager
+def replacing_composition():
+    """Блок, где состав рецепта меняется целиком.
+
+    Сигналы отдельных строк RecipeIngredient внутри него не порождают
+    recipe_ingredients_changed: вызывающий код отправит его сам, один раз.
+    """
+    _composition.replacing = True
+    try:
+        yield
+    finally:
+        _composition.replacing = False
+
+
+# правки отдельных строк (админка, инлайны)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    if getattr(_composition, 'replacing', False):
+        return
+    recipe_ingredients_changed.send(
+        sender=Recipe,
+        recipe_id=instance.recipe_id,
+        ingredient_ids=[instance.ingredient_id]
+    )
+
+
+@receiver(recipe_ingredients_changed)
+def touch_recipe(sender, recipe_id, **kwargs):
+    Recipe.objects.filter(pk=recipe_id).update(updated_at=timezone.now())
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_recipe_search(sender, recipe_id, **kwargs):
+    refresh_search_vectors([recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def refresh_saved_recipe_search(sender, instance, **kwargs):
+    refresh_search_vectors([instance.pk])
+
+
+@receiver(recipe_ingredients_changed)
+@receiver(post_delete, sender=Recipe)
+def sync_ingredient_sets(sender, **kwargs):
+    schedule_sync()
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created, **kwargs):
+    # название и единица ингредиента входят в ответ рецепта, а его кэш
+    # и ETag привязаны к updated_at; удаление ингредиента трогает рецепты
+    # через post_delete строк состава
+    if not created:
+        Recipe.objects.filter(
+            pk__in=RecipeIngredient.objects.filter(
+                ingredient=instance
+            ).values('recipe_id')
+        ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_recipes_search(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_vectors(RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values('recipe_id'))
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_carts_with_recipe(sender, recipe_id, ingredient_ids, **kwargs):
+    user_ids = Recipe.shopping_cart.through.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)
+    refresh_shopping_lists(user_ids, ingredient_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_carts_with_recipe(sender, instance, **kwargs):
+    # после удаления связи с корзинами уже не найти
+    instance._cart_user_ids = list(
+        instance.shopping_cart.values_list('pk', flat=True)
+    )
+    instance._cart_ingredient_ids = cart_ingredient_ids([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def refresh_carts_after_delete(sender, instance, **kwargs):
+    refresh_shopping_lists(
+        getattr(instance, '_cart_user_ids', []),
+        getattr(instance, '_cart_ingredient_ids', [])
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, **kwargs):
+    if variants_outdated(instance.image, instance.image_variants):
+        schedule_variants(instance, 'image', 'image_variants')
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter(User, [instance.author_id], 'recipes_count', 1)
+
+
+@receiver(pre_save, sender=Recipe)
+def choose_timeline_fanout(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.fanned_out = should_fan_out(instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_created_recipe(sender, instance, created, **kwargs):
+    if created and instance.fanned_out:
+        fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    adjust_counter(User, [instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_short_link(sender, instance, **kwargs):
+    # после коммита: иначе параллельный запрос успел бы снова
+    # закэшировать код из ещё не удалённой строки
+    transaction.on_commit(lambda: forget_short_code(instance.short_code))
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_cart(sender, instance, **kwargs):
+    # строки корзины удаляются каскадом без m2m_changed
+    instance._cart_recipe_ids = list(
+        instance.cart_recipes.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user_cart(sender, instance, **kwargs):
+    adjust_counter(
+        Recipe, getattr(instance, '_cart_recipe_ids', []),
+        'in_carts_count', -1
+    )
+
+
+@receiver(post_save, sender=User)
+def build_avatar_variants(sender, instance, **kwargs):
+    if variants_outdated(instance.avatar, instance.avatar_variants):
+        schedule_variants(instance, 'avatar', 'avatar_variants')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    # у нового пользователя ещё нет рецептов
+    if created or (update_fields and update_fields <= PRIVATE_USER_FIELDS):
+        return
+    transaction.on_commit(lambda: invalidate_author_payload(instance.pk))
+    bump_version_on_commit(author_version(instance.pk))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def bump_favorite_flags(sender, instance, **kwargs):
+    bump_version_on_commit(user_flags_version(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+def count_added_favorite(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter(Recipe, [instance.recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def count_removed_favorite(sender, instance, **kwargs):
+    adjust_counter(Recipe, [instance.recipe_id], 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_flags(sender, instance, **kwargs):
+    bump_version_on_commit(user_flags_version(instance.user_id))
+
+
+@receiver(post_save, sender=Follow)
+def count_added_follow(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter(User, [instance.following_id], 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_removed_follow(sender, instance, **kwargs):
+    adjust_counter(User, [instance.following_id], 'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline(sender, instance, **kwargs):
+    clear(instance.user_id, instance.following_id)
+
+
+@receiver(m2m_changed, sender=Recipe.shopping_cart.through)
+def cart_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # после clear содержимое корзины уже не узнать
+        related = instance.cart_recipes if reverse else instance.shopping_cart
+        instance._cleared_cart = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance._cleared_cart
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    if reverse:
+        user_ids, recipe_ids = [instance.pk], pk_set
+    else:
+        user_ids, recipe_ids = pk_set, [instance.pk]
+    cart_rows_changed(user_ids, recipe_ids, added=action == 'post_add')
+
+
+def cart_rows_changed(user_ids, recipe_ids, added):
+    """Обновить счётчики, флаги и списки покупок после записи в корзину.
+
+    Меняются все пары user_ids x recipe_ids; одна из сторон всегда из
+    одного элемента. Вызывается из m2m_changed и из view, которые пишут
+    строки ShoppingCart через api.relations.
+    """
+    delta = len(user_ids) if added else -len(user_ids)
+    adjust_counter(Recipe, recipe_ids, 'in_carts_count', delta)
+    bump_version_on_commit(*map(user_flags_version, user_ids))
+    refresh_shopping_lists(user_ids, cart_ingredient_ids(recipe_ids))
@@ -0,0 +1,147 @@
+"""Похожие рецепты: MinHash-подписи составов и LSH-корзины.
+
+Подпись рецепта - минимумы NUM_HASHES хеш-функций по id его
+ингредиентов; доля совпавших позиций двух подписей оценивает меру
+Жаккара их составов. Подпись режется на BANDS полос по ROWS значений,
+и кандидатами считаются рецепты, совпавшие с исходным хотя бы в одной
+полосе: пары с мерой Жаккара около 0.5 совпадают почти наверняка, около
+0.1 - почти никогда. Поиск кандидатов - бинарный поиск в отсортированных
+ключах полос, без перебора всего каталога.
+
+Индекс догоняет базу вместе с ingredient_sets по версии SETS_VERSION:
+изменённые рецепты получают новые ключи на месте и до пересортировки
+проверяются отдельно как «грязные» строки.
+"""
+import numpy as np
+
+from .ingredient_sets import CompositionIndex
+
+BANDS = 20
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+# хеш-функции (a * x + b) mod PRIME, x - id ингредиента
+PRIME = (1 << 31) - 1
+MIN_SIMILARITY = 0.25
+# сколько изменённых строк проверять перебором до пересортировки полос
+MAX_DIRTY = 1000
+
+_rng = np.random.default_rng(20240601)
+HASH_A = _rng.integers(1, PRIME, NUM_HASHES, dtype=np.uint64)
+HASH_B = _rng.integers(0, PRIME, NUM_HASHES, dtype=np.uint64)
+EMPTY_SIGNATURE = np.full(NUM_HASHES, PRIME, np.uint32)
+
+
+def ingredient_hashes(ingredient_ids):
+    """Матрица len(ingredient_ids) x NUM_HASHES значений хеш-функций."""
+    ids = np.asarray(ingredient_ids, np.uint64)[:, None]
+    return ((HASH_A * ids + HASH_B) % PRIME).astype(np.uint32)
+
+
+def signature(ingredient_ids):
+    if not len(ingredient_ids):
+        return EMPTY_SIGNATURE
+    return ingredient_hashes(ingredient_ids).min(axis=0)
+
+
+def band_keys(signatures):
+    """Ключи полос: по одному uint64 на каждые ROWS значений подписи."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    keys = np.zeros(bands.shape[:2], np.uint64)
+    for row in range(ROWS):
+        keys = keys * np.uint64(0x9E3779B97F4A7C15) + bands[:, :, row]
+    return keys
+
+
+class SimilarRecipeIndex(CompositionIndex):
+    """MinHash-подписи рецептов и отсортированные ключи LSH-полос."""
+
+    def __init__(self):
+        super().__init__()
+        self._load(np.zeros(0, np.int64), np.zeros(0, np.int64),
+                   np.zeros(0, np.int64))
+
+    def _load(self, recipe_ids, rows, ingredient_ids):
+        count = len(recipe_ids)
+        signatures = np.tile(EMPTY_SIGNATURE, (max(count, 1), 1))
+        if len(rows):
+            # хеши каждого ингредиента считаем один раз, потом минимум
+            # по строкам каждого рецепта
+            unique, slots = np.unique(ingredient_ids, return_inverse=True)
+            hashes = ingredient_hashes(unique)
+            order = np.argsort(rows, kind='stable')
+            rows, slots = rows[order], slots[order]
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            signatures[rows[starts]] = np.minimum.reduceat(
+                hashes[slots], starts
+            )
+        self._count = count
+        self._rows = dict(zip(recipe_ids.tolist(), range(count)))
+        self._recipe_ids = np.array(recipe_ids, np.int64)
+        self._signatures = signatures
+        self._keys = band_keys(signatures)
+        self._reindex()
+
+    def _reindex(self):
+        count = self._count
+        self._order = np.argsort(self._keys[:count], axis=0, kind='stable').T
+        self._sorted_keys = np.take_along_axis(
+            self._keys[:count], self._order.T, axis=0
+        ).T
+        self._dirty = set()
+
+    def _set_recipe(self, recipe_id, ingredient_ids):
+        row = self._rows.get(recipe_id)
+        if row is None:
+            row = self._rows[recipe_id] = self._count
+            self._count += 1
+            if row >= len(self._recipe_ids):
+                capacity = max(2 * len(self._recipe_ids), 8)
+                self._recipe_ids = np.resize(self._recipe_ids, capacity)
+                self._signatures = np.resize(
+                    self._signatures, (capacity, NUM_HASHES)
+                )
+                self._keys = np.resize(self._keys, (capacity, BANDS))
+            self._recipe_ids[row] = recipe_id
+        self._signatures[row] = signature(ingredient_ids)
+        self._keys[row] = band_keys(self._signatures[row:row + 1])[0]
+        self._dirty.add(row)
+        if len(self._dirty) > MAX_DIRTY:
+            self._reindex()
+
+    def _candidates(self, row):
+        keys = self._keys[row]
+        dirty = np.fromiter(self._dirty, np.int64, len(self._dirty))
+        found = [dirty[(self._keys[dirty] == keys).any(axis=1)]]
+        for band in range(BANDS):
+            sorted_keys = self._sorted_keys[band]
+            start = np.searchsorted(sorted_keys, keys[band], 'left')
+            end = np.searchsorted(sorted_keys, keys[band], 'right')
+            rows = self._order[band, start:end]
+            # ключ строки мог смениться после сортировки
+            found.append(rows[self._keys[rows, band] == keys[band]])
+        candidates = np.unique(np.concatenate(found))
+        return candidates[candidates != row]
+
+    def similar(self, recipe_id, limit):
+        """Пары (id, оценка меры Жаккара) самых похожих рецептов.
+
+        None, если рецепта нет в индексе.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            row = self._rows.get(recipe_id)
+            if row is None:
+                return None
+            source = self._signatures[row]
+            if (source == EMPTY_SIGNATURE).all():
+                return []
+            candidates = self._candidates(row)
+            scores = (self._signatures[candidates] == source).mean(axis=1)
+            keep = scores >= MIN_SIMILARITY
+            candidates, scores = candidates[keep], scores[keep]
+            ids = self._recipe_ids[candidates]
+            best = np.lexsort((-ids, -scores))[:limit]
+            return list(zip(ids[best].tolist(), scores[best].tolist()))
+
+
+similar_recipe_index = SimilarRecipeIndex()
@@ -0,0 +1,199 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
+
+from ingredients.models import Ingredient, RecipeIngredient
+
+from .models import Favorite, Recipe
+
+User = get_user_model()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username,
+        first_name=username, last_name=username, password='password'
+    )
+
+
+def create_recipe(author, name='рецепт'):
+    # варианты помечены готовыми, чтобы не искать картинку на диске
+    return Recipe.objects.create(
+        author=author, name=name, image='recipes/test.png',
+        image_variants={'source': 'recipes/test.png'}, text='текст',
+        cooking_time=10
+    )
+
+
+class RecipeListQueriesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        authors = [create_user(f'author{i}') for i in range(3)]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(5)
+        )
+        for i in range(25):
+            recipe = create_recipe(authors[i % len(authors)], f'рецепт {i}')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for ingredient in ingredients[:3 + i % 3]
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_queries_do_not_depend_on_page_size(self):
+        small, small_data = self.count_queries('/api/recipes/?limit=2')
+        large, large_data = self.count_queries('/api/recipes/?limit=20')
+        self.assertEqual(len(small_data['results']), 2)
+        self.assertEqual(len(large_data['results']), 20)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 5)
+
+
+
+class RecipeValidatorsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.recipe = create_recipe(create_user('author'))
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=100
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.viewer)
+
+    def assert_renamed_ingredient_refetched(self, url, get_ingredients):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.ingredient.name = 'мука пшеничная'
+        self.ingredient.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['name'] for item in get_ingredients(response.data)],
+            ['мука пшеничная']
+        )
+
+    def test_retrieve_after_ingredient_rename(self):
+        self.assert_renamed_ingredient_refetched(
+            f'/api/recipes/{self.recipe.pk}/',
+            lambda data: data['ingredients']
+        )
+
+    def test_list_after_ingredient_rename(self):
+        self.assert_renamed_ingredient_refetched(
+            '/api/recipes/', lambda data: data['results'][0]['ingredients']
+        )
+
+class InsertOnceMixin:
+    """Проверки вставки связи через insert_row: ровно одна строка."""
+
+    THREADS = 8
+
+    def assert_inserted_once(self, url, rows):
+        statuses = [self.client.post(url).status_code for _ in range(2)]
+        self.assertEqual(statuses, [201, 400])
+        self.assertEqual(rows.count(), 1)
+        statuses = [self.client.delete(url).status_code for _ in range(2)]
+        self.assertEqual(statuses, [204, 400])
+        self.assertFalse(rows.exists())
+
+    def post_concurrently(self, user, url):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                statuses.append(client.post(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_inserted_once_concurrently(self, user, url, rows):
+        statuses = self.post_concurrently(user, url)
+        self.assertEqual(statuses, [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(rows.count(), 1)
+
+
+# вставка идёт через INSERT ... ON CONFLICT DO NOTHING RETURNING
+@skipUnlessDBFeature(
+    'supports_update_conflicts', 'can_return_rows_from_bulk_insert'
+)
+class RecipeRelationsTest(InsertOnceMixin, APITestCase):
+    def setUp(self):
+        self.user = create_user('user')
+        self.recipe = create_recipe(create_user('author'))
+        self.client.force_authenticate(self.user)
+
+    def test_favorite(self):
+        self.assert_inserted_once(
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            Favorite.objects.filter(user=self.user, recipe=self.recipe)
+        )
+
+    def test_shopping_cart(self):
+        self.assert_inserted_once(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            Recipe.shopping_cart.through.objects.filter(
+                user=self.user, recipe=self.recipe
+            )
+        )
+
+
+# нужна ещё и параллельная запись (в SQLite пишущая транзакция
+# блокирует всю базу)
+@skipUnlessDBFeature(
+    'supports_update_conflicts', 'can_return_rows_from_bulk_insert',
+    'has_select_for_update'
+)
+class ConcurrentRecipeRelationsTest(InsertOnceMixin, TransactionTestCase):
+    def setUp(self):
+        self.user = create_user('user')
+        self.recipe = create_recipe(create_user('author'))
+
+    def test_favorite(self):
+        self.assert_inserted_once_concurrently(
+            self.user, f'/api/recipes/{self.recipe.pk}/favorite/',
+            Favorite.objects.filter(user=self.user, recipe=self.recipe)
+        )
+
+    def test_shopping_cart(self):
+        self.assert_inserted_once_concurrently(
+            self.user, f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            Recipe.shopping_cart.through.objects.filter(
+                user=self.user, recipe=self.recipe
+            )
+        )
@@ -0,0 +1,84 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт автора, у которого не больше TIMELINE_FANOUT_LIMIT
+подписчиков, сразу раскладывается строками TimelineEntry по лентам всех
+подписчиков (fan-out on write) и помечается fanned_out. Рецепты
+популярных авторов не копируются: лента дочитывает их из Recipe по
+частичному индексу recipe_not_fanned_out_idx (fan-out on read).
+
+При подписке в ленту попадают TIMELINE_BACKFILL последних разосланных
+рецептов автора, при отписке его записи удаляются.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from users.models import Follow
+
+from .models import Recipe, TimelineEntry
+
+User = get_user_model()
+
+TIMELINE_BACKFILL = 50
+BATCH_SIZE = 1000
+
+
+def should_fan_out(author_id):
+    # счётчик читаем из базы: у объекта автора он мог устареть
+    followers = User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    return (followers or 0) <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    """Добавить рецепт в ленты подписчиков автора."""
+    follower_ids = Follow.objects.filter(
+        following_id=recipe.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe.pk,
+                author_id=recipe.author_id, created_at=recipe.created_at
+            )
+            for user_id in follower_ids.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    recipes = Recipe.objects.filter(
+        author_id=author_id, fanned_out=True
+    ).order_by('-created_at', '-id').values_list(
+        'pk', 'created_at'
+    )[:TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                created_at=created_at
+            )
+            for recipe_id, created_at in recipes
+        ],
+        ignore_conflicts=True
+    )
+
+
+def clear(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def followed_timeline(user):
+    """Пары (id рецепта, created_at) ленты, новые первыми."""
+    pulled = Recipe.objects.filter(
+        fanned_out=False,
+        author__in=Follow.objects.filter(user=user).values('following')
+    ).order_by().values_list('pk', 'created_at')
+    return TimelineEntry.objects.filter(user=user).order_by().values_list(
+        'recipe_id', 'created_at'
+    ).union(pulled, all=True).order_by(
+        F('created_at').desc(), F('recipe_id').desc()
+    )
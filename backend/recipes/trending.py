@@ -0,0 +1,92 @@
+"""Рейтинги рецептов для ordering=trending и ordering=popular.
+
+Команда compute_trending периодически пересчитывает таблицу RecipeScore:
+- trending - сумма добавлений в избранное и в списки покупок за WINDOW,
+  каждое с весом, убывающим вдвое за каждые HALF_LIFE;
+- popular - то же за всё время без затухания (по счётчикам рецепта).
+Запросы выдачи только сортируют по готовой таблице, а время пересчёта
+(computed_at) входит в ETag и Last-Modified таких выдач.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+HALF_LIFE = timedelta(days=3)
+# дальше вклад события меньше 0.1% от свежего
+WINDOW = timedelta(days=30)
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+BATCH_SIZE = 1000
+
+ORDERINGS = ('trending', 'popular')
+
+
+def decayed_sums(events, now, half_life):
+    """Суммы весов событий (id рецепта, время) по рецептам."""
+    recipe_ids, ages = [], []
+    for recipe_id, created_at in events.iterator(chunk_size=BATCH_SIZE):
+        recipe_ids.append(recipe_id)
+        ages.append((now - created_at).total_seconds())
+    if not recipe_ids:
+        return {}
+    recipe_ids = np.array(recipe_ids)
+    weights = np.exp2(-np.maximum(ages, 0) / half_life.total_seconds())
+    unique, index = np.unique(recipe_ids, return_inverse=True)
+    return dict(zip(
+        unique.tolist(), np.bincount(index, weights=weights).tolist()
+    ))
+
+
+def compute_scores(now=None, half_life=HALF_LIFE, window=WINDOW):
+    """Пересчитать RecipeScore целиком; вернуть число рецептов в рейтинге."""
+    now = now or timezone.now()
+    since = now - window
+    trending = {}
+    for model, weight in (
+        (Favorite, FAVORITE_WEIGHT), (ShoppingCart, CART_WEIGHT)
+    ):
+        events = model.objects.filter(created_at__gte=since).order_by(
+        ).values_list('recipe_id', 'created_at')
+        for recipe_id, total in decayed_sums(events, now, half_life).items():
+            trending[recipe_id] = trending.get(recipe_id, 0) + weight * total
+
+    scores = [
+        RecipeScore(
+            recipe_id=recipe_id,
+            computed_at=now,
+            trending=trending.get(recipe_id, 0),
+            popular=(
+                FAVORITE_WEIGHT * favorites + CART_WEIGHT * in_carts
+            )
+        )
+        for recipe_id, favorites, in_carts in Recipe.objects.filter(
+            # события за окно есть только у рецептов с ненулевыми счётчиками
+            Q(favorites_count__gt=0) | Q(in_carts_count__gt=0)
+        ).values_list('pk', 'favorites_count', 'in_carts_count').iterator(
+            chunk_size=BATCH_SIZE
+        )
+    ]
+    with transaction.atomic():
+        RecipeScore.objects.all().delete()
+        RecipeScore.objects.bulk_create(scores, batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def scores_computed_at():
+    """Время последнего пересчёта; None, если рейтинг пуст."""
+    return RecipeScore.objects.values_list('computed_at', flat=True).first()
+
+
+def order_by_score(queryset, ordering):
+    """Рецепты в порядке ordering ('trending' или 'popular').
+
+    Рецепты без оценки не отбрасываются, а идут после оценённых.
+    """
+    return queryset.order_by(
+        F(f'score__{ordering}').desc(nulls_last=True), '-created_at', '-id'
+    )
@@ -1,43 +1,180 @@
-from collections import defaultdict
-
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
-from api.pagination import LimitPageNumberPagination
+from api.conditional import conditional_response, make_etag, set_validators
+from api.counts import COUNT_ESTIMATED, COUNT_EXACT, table_version_name
+from api.pagination import FeedPagination
+from api.relations import delete_rows, insert_row, insert_rows
+from api.versions import get_versions
 
 from .filters import RecipeFilter
-from .models import Recipe
-from .serializers import RecipeCreateSerializer, RecipeReadSerializer, RecipeShortSerializer
+from .models import Favorite, Recipe
+from .serializers import (RecipeBatchSerializer, RecipeCreateSerializer,
+                          RecipeReadSerializer, RecipeShortSerializer)
 from .permissions import IsAuthorOrReadOnly
-from ingredients.models import RecipeIngredient
+from .shopping_list import EXPORT_FORMATS, export_shopping_list
+from .shortlinks import resolve_short_code
+from .similar import similar_recipe_index
+from .timeline import followed_timeline
+from .trending import scores_computed_at
+from .signals import author_version, cart_rows_changed, user_flags_version
+
+Cart = Recipe.shopping_cart.through
+
+SHORT_LINK_MAX_AGE = 60 * 60 * 24
+
+SIMILAR_LIMIT = 6
+MAX_SIMILAR_LIMIT = 30
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly]
+    lookup_value_regex = r'\d+'
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
-    pagination_class = LimitPageNumberPagination
+    pagination_class = FeedPagination
+    count_strategy = COUNT_ESTIMATED
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        return Recipe.objects.for_read(self.request.user)
+
+    def get_validators(self, recipes, *versions, changed_at=None):
+        """ETag и Last-Modified выдачи рецептов для текущего пользователя.
+
+        recipes - тройки (id, updated_at, author_id) рецептов в ответе,
+        changed_at - время ещё одного изменения выдачи, записанное в базе.
+        """
         user = self.request.user
+        author_ids = sorted({author_id for _, _, author_id in recipes})
+        stamps = get_versions(
+            user_flags_version(user.pk), *versions,
+            *map(author_version, author_ids)
+        )
+        updated = [
+            (pk, updated_at.timestamp()) for pk, updated_at, _ in recipes
+        ]
+        changed_at = changed_at.timestamp() if changed_at else 0
+        last_modified = max(
+            [timestamp for _, timestamp in updated] + stamps + [changed_at]
+        )
+        etag = make_etag(
+            self.request.get_full_path(), user.pk, updated, changed_at,
+            *stamps
+        )
+        return etag, last_modified
 
-        is_in_cart = self.request.query_params.get('is_in_shopping_cart')
-        if is_in_cart in ['1', 'true', 'True'] and user.is_authenticated:
-            queryset = queryset.filter(shopping_cart=user)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # ETag считается по строкам страницы (рецепты и их авторы), а
+        # рецепты целиком с prefetch читаются, только если это не 304;
+        # created_at нужен курсорной пагинации
+        rows = self.paginate_queryset(queryset.prefetch_related(None).values(
+            'id', 'updated_at', 'author_id', 'created_at'
+        ))
+        # порядок меняется при пересчёте рейтинга, а не рецептов;
+        # compute_trending работает в другом процессе, поэтому время
+        # пересчёта берём из базы
+        changed_at = (
+            scores_computed_at() if request.query_params.get('ordering')
+            else None
+        )
+        etag, last_modified = self.get_validators(
+            [(row['id'], row['updated_at'], row['author_id']) for row in rows],
+            table_version_name(Recipe._meta.db_table),
+            changed_at=changed_at
+        )
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        ids = [row['id'] for row in rows]
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True
+        )
+        response = self.get_paginated_response(serializer.data)
+        return set_validators(response, etag, last_modified)
 
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited in ['1', 'true', 'True'] and user.is_authenticated:
-            queryset = queryset.filter(favorites__user=user)
+    def retrieve(self, request, *args, **kwargs):
+        recipe = Recipe.objects.filter(pk=kwargs['pk']).values_list(
+            'pk', 'updated_at', 'author_id'
+        ).first()
+        if recipe is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = self.get_validators([recipe])
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
 
-        return queryset
+    def batch_update(self, request, model):
+        """Добавить/удалить пачку рецептов в корзине или избранном.
+
+        Один запрос проверяет, какие рецепты существуют, второй вставляет
+        или удаляет строки; в ответе статус для каждого id.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        user = request.user
+        existing = set(
+            Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = insert_rows(model, [
+                    {'user_id': user.pk, 'recipe_id': recipe_id}
+                    for recipe_id in ids if recipe_id in existing
+                ])
+                statuses = ('added', 'exists')
+            else:
+                changed = delete_rows(model, user=user.pk, recipe=[
+                    recipe_id for recipe_id in ids if recipe_id in existing
+                ])
+                statuses = ('removed', 'absent')
+            changed = {row.recipe_id for row in changed}
+            if model is Cart and changed:
+                cart_rows_changed(
+                    [user.pk], changed, added=request.method == 'POST'
+                )
+
+        return Response({'results': [
+            {
+                'id': recipe_id,
+                'status': (
+                    'not_found' if recipe_id not in existing
+                    else statuses[recipe_id not in changed]
+                )
+            }
+            for recipe_id in ids
+        ]})
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='shopping_cart'
+    )
+    def batch_shopping_cart(self, request):
+        return self.batch_update(request, Cart)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='favorite'
+    )
+    def batch_favorite(self, request):
+        return self.batch_update(request, Favorite)
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -58,11 +195,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return Response(read_serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def timeline(self, request):
+        # COUNT по ленте одного пользователя дешёвый, а кэш устаревал бы:
+        # bulk_create в TimelineEntry не сбрасывает версии таблиц
+        self.count_strategy = COUNT_EXACT
+        page = self.paginate_queryset(followed_timeline(request.user))
+        ids = [recipe_id for recipe_id, _ in page]
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        limit = request.query_params.get('limit')
+        limit = (
+            min(int(limit), MAX_SIMILAR_LIMIT) if limit and limit.isdigit()
+            else SIMILAR_LIMIT
+        )
+        ranked = similar_recipe_index.similar(int(pk), limit)
+        if ranked is None:
+            # рецепт мог появиться после последней синхронизации индекса
+            get_object_or_404(Recipe, pk=pk)
+            ranked = []
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in ranked]
+        )
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _ in ranked
+             if recipe_id in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk=None):
-        recipe = self.get_object()
-        short_code = f"s/{recipe.id}"
-        short_link = request.build_absolute_uri(f"/{short_code}")
+        recipe = get_object_or_404(Recipe.objects.only('short_code'), pk=pk)
+        short_link = request.build_absolute_uri(f"/s/{recipe.short_code}/")
         return Response({"short-link": short_link}, status=status.HTTP_200_OK)
 
     @action(
@@ -73,37 +249,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def add_to_shopping_cart(self, request, pk=None):
         user = request.user
-        recipe = self.get_object()
-
-        if recipe.shopping_cart.filter(id=user.id).exists():
-            return Response(
-                {"detail": "Рецепт уже в списке покупок."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        recipe = get_object_or_404(Recipe, pk=pk)
 
-        recipe.shopping_cart.add(user)
+        with transaction.atomic():
+            if insert_row(Cart, user=user, recipe=recipe) is None:
+                return Response(
+                    {"detail": "Рецепт уже в списке покупок."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            cart_rows_changed([user.pk], [recipe.pk], added=True)
         serializer = RecipeShortSerializer(recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @add_to_shopping_cart.mapping.delete
     def remove_from_shopping_cart(self, request, pk=None):
         user = request.user
-        try:
-            recipe = self.get_object()
-        except Recipe.DoesNotExist:
-            return Response(
-                {"detail": "Рецепт не найден."},
-                status=status.HTTP_404_NOT_FOUND
-            )
 
-        if not recipe.shopping_cart.filter(id=user.id).exists():
-            return Response(
-                {"detail": "Рецепт не в списке покупок."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        recipe.shopping_cart.remove(user)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            if delete_rows(Cart, user=user.pk, recipe=pk):
+                cart_rows_changed([user.pk], [int(pk)], added=False)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
+        return Response(
+            {"detail": "Рецепт не в списке покупок."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     @action(
         detail=False,
@@ -112,29 +282,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        user = request.user
-
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart=user
-        ).values(
-            name=F('ingredient__name'),
-            unit=F('ingredient__measurement_unit')
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('name')
-
-        lines = ['Список покупок:\n']
-        for item in ingredients:
-            line = f"{item['name']} ({item['unit']}) — {item['total_amount']}\n"
-            lines.append(line)
-
-        content = ''.join(lines)
-
-        response = HttpResponse(
-            content,
-            content_type='text/plain; charset=utf-8'
+        export_format = request.query_params.get('type', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'type': f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type = EXPORT_FORMATS[export_format][0]
+        response = StreamingHttpResponse(
+            export_shopping_list(request.user, export_format),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{export_format}"'
         )
-        response['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
         return response
 
     @action(
@@ -144,24 +305,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, pk=None):
         user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
 
         if request.method == 'POST':
-            if recipe.favorites.filter(user=user).exists():
+            recipe = get_object_or_404(Recipe, pk=pk)
+            if insert_row(Favorite, user=user, recipe=recipe) is None:
                 return Response(
                     {"detail": "Рецепт уже в избранном."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            recipe.favorites.create(user=user)
             serializer = RecipeShortSerializer(recipe, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            favorite = recipe.favorites.filter(user=user).first()
-            if not favorite:
-                return Response(
-                    {"detail": "Рецепта нет в избранном."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+            if delete_rows(Favorite, user=user.pk, recipe=pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe, pk=pk)
+            return Response(
+                {"detail": "Рецепта нет в избранном."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
+def short_link_redirect(request, code):
+    recipe_id = resolve_short_code(code)
+    if recipe_id is None:
+        raise Http404('Рецепт не найден.')
+    response = HttpResponseRedirect(f'/recipes/{recipe_id}')
+    response['Cache-Control'] = f'public, max-age={SHORT_LINK_MAX_AGE}'
+    return response
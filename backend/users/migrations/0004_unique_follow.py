@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    User = apps.get_model('users', 'User')
+
+    affected = set(Follow.objects.filter(
+        user=F('following')
+    ).values_list('following_id', flat=True))
+    Follow.objects.filter(user=F('following')).delete()
+    duplicates = Follow.objects.values('user', 'following').annotate(
+        keep=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in duplicates:
+        Follow.objects.filter(
+            user_id=group['user'], following_id=group['following']
+        ).exclude(pk=group['keep']).delete()
+        affected.add(group['following'])
+
+    User.objects.filter(pk__in=affected).update(followers_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(following=OuterRef('pk')).order_by()
+            .values('following').annotate(total=Count('pk')).values('total')
+        ), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'following'), name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(condition=models.Q(('user', models.F('following')), _negated=True), name='prevent_self_follow'),
+        ),
+    ]
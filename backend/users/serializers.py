@@ -1,13 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, password_validation
 from django.contrib.auth.password_validation import validate_password
-from drf_extra_fields.fields import Base64ImageField
 import re
 
+from api.fields import ImageUploadField
+from api.images import variant_urls
+
 
 User = get_user_model()
 
 
+def followed_ids(request):
+    """Id авторов, на которых подписан пользователь, - один запрос к БД
+    на весь HTTP-запрос, сколько бы объектов ни сериализовалось."""
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = set(
+            request.user.follower.values_list('following_id', flat=True)
+        )
+    return request._followed_ids
+
+
+def is_subscribed(request, author):
+    if request is None or request.user.is_anonymous:
+        return False
+    # аннотация из User.objects.with_is_subscribed
+    if hasattr(author, 'is_subscribed'):
+        return author.is_subscribed
+    return author.pk in followed_ids(request)
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
@@ -46,6 +67,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    avatar_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -57,17 +79,20 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return obj.following.filter(user=request.user).exists()
+        return is_subscribed(self.context.get('request'), obj)
+
+    def get_avatar_variants(self, obj):
+        return variant_urls(
+            obj.avatar, obj.avatar_variants, self.context.get('request')
+        )
 
 
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField(required=True)
+    avatar = ImageUploadField(required=True)
 
     class Meta:
         model = User
@@ -92,7 +117,7 @@ class SetPasswordSerializer(serializers.Serializer):
 class SubscriptionUserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
     avatar = serializers.ImageField(read_only=True)
 
     class Meta:
@@ -101,16 +126,16 @@ class SubscriptionUserSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count', 'avatar')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return obj.following.filter(user=request.user).exists()
+        return is_subscribed(self.context.get('request'), obj)
 
     def get_recipes(self, obj):
         from recipes.serializers import RecipeShortSerializer
         request = self.context.get('request')
         recipes_limit = request.query_params.get('recipes_limit')
         recipes_qs = obj.recipes.all()
+        if hasattr(obj, 'recipes_page'):
+            # уже обрезано по recipes_limit в UserViewSet.subscriptions
+            recipes_qs, recipes_limit = obj.recipes_page, None
         if recipes_limit:
             try:
                 limit = int(recipes_limit)
@@ -123,6 +148,3 @@ class SubscriptionUserSerializer(serializers.ModelSerializer):
             context=self.context
         )
         return serializer.data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,42 @@
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework.test import APITestCase
+
+from recipes.tests import InsertOnceMixin, create_user
+
+from .models import Follow
+
+
+class SubscribeTest(InsertOnceMixin, APITestCase):
+    def setUp(self):
+        self.user = create_user('user')
+        self.author = create_user('author')
+        self.client.force_authenticate(self.user)
+
+    def test_cannot_subscribe_to_self(self):
+        for pk in (self.user.pk, f'0{self.user.pk}'):
+            response = self.client.post(f'/api/users/{pk}/subscribe/')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+    @skipUnlessDBFeature(
+        'supports_update_conflicts', 'can_return_rows_from_bulk_insert'
+    )
+    def test_subscribe(self):
+        self.assert_inserted_once(
+            f'/api/users/{self.author.pk}/subscribe/',
+            Follow.objects.filter(user=self.user, following=self.author)
+        )
+
+
+# см. recipes.tests.ConcurrentRecipeRelationsTest
+@skipUnlessDBFeature(
+    'supports_update_conflicts', 'can_return_rows_from_bulk_insert',
+    'has_select_for_update'
+)
+class ConcurrentSubscribeTest(InsertOnceMixin, TransactionTestCase):
+    def test_subscribe(self):
+        user, author = create_user('user'), create_user('author')
+        self.assert_inserted_once_concurrently(
+            user, f'/api/users/{author.pk}/subscribe/',
+            Follow.objects.filter(user=user, following=author)
+        )
@@ -1,12 +1,17 @@
-from django.core.paginator import Paginator
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics, viewsets
-from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, Value
+
+from api.counts import COUNT_CACHED, COUNT_ESTIMATED
+from api.pagination import CountStrategyPagination
+from api.relations import delete_rows, insert_row
+
+from recipes.models import Recipe
 
 from .models import Follow
 from .serializers import (UserCreateSerializer,
@@ -18,7 +23,7 @@ from .serializers import (UserCreateSerializer,
 User = get_user_model()
 
 
-class CustomPagination(PageNumberPagination):
+class CustomPagination(CountStrategyPagination):
     page_size = 10
     page_size_query_param = 'limit'
 
@@ -26,11 +31,12 @@ class CustomPagination(PageNumberPagination):
 class UserListCreateView(APIView):
     permission_classes = [permissions.AllowAny]
     pagination_class = CustomPagination
+    count_strategy = COUNT_ESTIMATED
 
     def get(self, request):
-        users = User.objects.all()
+        users = User.objects.with_is_subscribed(request.user)
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(users, request)
+        page = paginator.paginate_queryset(users, request, view=self)
         serializer = UserSerializer(
             page,
             many=True,
@@ -54,6 +60,9 @@ class UserRetrieveView(generics.RetrieveAPIView):
     permission_classes = [permissions.AllowAny]
     lookup_field = 'id'
 
+    def get_queryset(self):
+        return User.objects.with_is_subscribed(self.request.user)
+
 
 class UserMeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -86,7 +95,10 @@ class UserAvatarUpdateDeleteView(APIView):
     def delete(self, request):
         user = request.user
         if user.avatar:
-            user.avatar.delete(save=True)
+            # файл может быть общим с другими пользователями (одинаковое
+            # содержимое), его удалит cleanup_media, когда ссылок не останется
+            user.avatar = None
+            user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -101,33 +113,35 @@ class SetPasswordView(APIView):
         serializer.is_valid(raise_exception=True)
         user = request.user
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class UserViewSet(viewsets.GenericViewSet):
     queryset = User.objects.all()
+    lookup_value_regex = r'\d+'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPagination
+    count_strategy = COUNT_CACHED
 
     @action(detail=True, methods=['post', 'delete'], url_path='subscribe')
     def subscribe(self, request, pk=None):
         user = request.user
-        author = get_object_or_404(User, pk=pk)
 
-        if user == author:
+        # pk из URL - строка цифр, возможно с ведущими нулями
+        if int(pk) == user.pk:
             return Response(
                 {'detail': 'Нельзя подписаться на себя.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if request.method == 'POST':
-            if user.follower.filter(following=author).exists():
+            author = get_object_or_404(User, pk=pk)
+            if insert_row(Follow, user=user, following=author) is None:
                 return Response(
                     {'detail': 'Вы уже подписаны на этого пользователя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Follow.objects.create(user=user, following=author)
             serializer = SubscriptionUserSerializer(
                 author,
                 context={'request': request}
@@ -135,23 +149,32 @@ class UserViewSet(viewsets.GenericViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            follow = user.follower.filter(following=author).first()
-            if not follow:
-                return Response(
-                    {'detail': 'Вы не подписаны на этого пользователя.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            follow.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            if delete_rows(Follow, user=user.pk, following=pk):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, pk=pk)
+            return Response(
+                {'detail': 'Вы не подписаны на этого пользователя.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
     @action(detail=False, methods=['get'], url_path='subscriptions')
     def subscriptions(self, request):
         user = request.user
+        # срез в Prefetch Django выполняет одним запросом через
+        # ROW_NUMBER() OVER (PARTITION BY author_id)
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
         # получаем queryset пользователей, на которых подписан юзер:
-        following_qs = User.objects.filter(follower__user=user)
+        following_qs = User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True)
+        ).order_by('email').prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_page')
+        )
 
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(following_qs, request)
+        page = paginator.paginate_queryset(following_qs, request, view=self)
         serializer = SubscriptionUserSerializer(
             page,
             many=True,